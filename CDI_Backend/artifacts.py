@@ -0,0 +1,260 @@
+"""
+Analysis Artifact Store
+-----------------------
+Per-analysis result and image files under UPLOAD_DIR, written off the event
+loop and pruned by total size, count and age, optionally with the retention
+index kept in SharedState so the limits hold across worker processes
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from metrics import STAGE_SECONDS
+from serialization import dumps, loads
+
+ANALYSIS_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ArtifactStore:
+    """Stores each analysis as ``<root>/<analysis_id>/{analysis.json,image.jpg}``
+
+    Artifacts are staged in memory first so they can be looked up before the
+    deferred write has finished.
+
+    With ``shared`` (a shared_state.SharedState), the size/age index lives in
+    the shared database, so every worker prunes against the node-wide
+    totals, and staged results are also published there for
+    ``staged_ttl`` seconds so other workers can serve them before the files
+    exist.
+    """
+
+    def __init__(self, root, max_bytes=500 * 1024 * 1024, max_age=7 * 86400, max_count=10000,
+                 shared=None, staged_ttl=600, poll_interval=0.05):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_count = max_count
+        self.shared = shared
+        self.staged_ttl = staged_ttl
+        self.poll_interval = poll_interval
+        self.pruned = 0
+        self.write_errors = 0
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._pending = {}
+        self._flushing = {}
+        self._tasks = set()
+        self._shared_writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_id(analysis_id):
+        return isinstance(analysis_id, str) and bool(ANALYSIS_ID_PATTERN.match(analysis_id))
+
+    def path(self, analysis_id, name=""):
+        return os.path.join(self.root, analysis_id, name)
+
+    def _staged_key(self, analysis_id):
+        return f"artifact-staged:{analysis_id}"
+
+    def _load_index(self):
+        """Rebuild the size/age index from artifacts already on disk"""
+        entries = self._scan()
+        if self.shared is not None:
+            # Artifacts written before the shared index existed, or by a crashed worker
+            self.shared.artifact_add_missing(entries)
+            return
+        for created_at, analysis_id, size in sorted(entries):
+            self._index[analysis_id] = (created_at, size)
+            self._total_bytes += size
+
+    def _scan(self):
+        """(created_at, analysis_id, size) for every artifact directory on disk"""
+        entries = []
+        for analysis_id in os.listdir(self.root):
+            directory = self.path(analysis_id)
+            if not self.is_valid_id(analysis_id) or not os.path.isdir(directory):
+                continue
+            size = 0
+            for name in os.listdir(directory):
+                try:
+                    size += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    pass
+            entries.append((os.path.getmtime(directory), analysis_id, size))
+        return entries
+
+    async def stage(self, analysis_id, result, image_bytes):
+        """Keep an artifact in memory until flush() writes it
+
+        With shared state the result is published before this returns, so
+        any worker can load it as soon as its id is handed out.
+        """
+        self._pending[analysis_id] = (result, image_bytes)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.cache_set, self._staged_key(analysis_id), result, self.staged_ttl)
+            except sqlite3.Error as e:
+                print(f"Could not share staged artifact {analysis_id}: {str(e)}")
+
+    async def flush(self, analysis_id, timeout=10.0):
+        """Write a staged artifact in a worker thread and apply the retention policy
+
+        For an artifact staged by another worker, wait up to timeout seconds
+        for that worker to write it.
+        """
+        running = self._flushing.get(analysis_id)
+        if running is not None:
+            # Another caller is already writing it; just wait for that write
+            await asyncio.wait([running])
+            return
+        staged = self._pending.get(analysis_id)
+        if staged is None:
+            await self._wait_for_other_worker(analysis_id, timeout)
+            return
+        write = asyncio.ensure_future(asyncio.to_thread(self._write, analysis_id, *staged))
+        self._flushing[analysis_id] = write
+        try:
+            with STAGE_SECONDS.time(stage="artifact_write"):
+                await write
+        except Exception as e:
+            self.write_errors += 1
+            print(f"Artifact write error for {analysis_id}: {str(e)}")
+        finally:
+            self._flushing.pop(analysis_id, None)
+            self._pending.pop(analysis_id, None)
+
+    async def _wait_for_other_worker(self, analysis_id, timeout):
+        if self.shared is None or not self.is_valid_id(analysis_id):
+            return
+        started = time.monotonic()
+        try:
+            while await asyncio.to_thread(self.shared.cache_get, self._staged_key(analysis_id)) is not None:
+                if time.monotonic() - started >= timeout:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        except sqlite3.Error as e:
+            print(f"Could not check staged artifact {analysis_id}: {str(e)}")
+
+    async def defer(self, analysis_id, result, image_bytes):
+        """Stage an artifact and write it in the background"""
+        await self.stage(analysis_id, result, image_bytes)
+        task = asyncio.ensure_future(self.flush(analysis_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Wait for background writes, e.g. on shutdown"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _write(self, analysis_id, result, image_bytes):
+        directory = self.path(analysis_id)
+        os.makedirs(directory, exist_ok=True)
+        size = 0
+        if image_bytes is not None:
+            with open(os.path.join(directory, "image.jpg"), "wb") as f:
+                f.write(image_bytes)
+            size += len(image_bytes)
+        encoded = dumps(result)
+        with open(os.path.join(directory, "analysis.json"), "wb") as f:
+            f.write(encoded)
+        size += len(encoded)
+
+        if self.shared is not None:
+            self.shared.cache_delete(self._staged_key(analysis_id))
+            self.shared.artifact_add(analysis_id, size)
+            self._shared_writes += 1
+            if self._shared_writes % 100 == 0:
+                # Staged entries of workers that died before writing them
+                self.shared.cache_prune("artifact-staged:", self.max_count)
+            expired = self.shared.artifact_expire(self.max_bytes, self.max_count, self.max_age)
+        else:
+            with self._lock:
+                self._index[analysis_id] = (time.time(), size)
+                self._total_bytes += size
+                expired = self._select_expired()
+        for expired_id in expired:
+            shutil.rmtree(self.path(expired_id), ignore_errors=True)
+        self.pruned += len(expired)
+
+    def _select_expired(self):
+        """Pop the oldest artifacts until size, count and age limits hold"""
+        expired = []
+        cutoff = time.time() - self.max_age
+        while self._index:
+            oldest_id, (created_at, size) = next(iter(self._index.items()))
+            if (self._total_bytes <= self.max_bytes
+                    and len(self._index) <= self.max_count
+                    and created_at >= cutoff):
+                break
+            self._index.popitem(last=False)
+            self._total_bytes -= size
+            expired.append(oldest_id)
+        return expired
+
+    def load(self, analysis_id):
+        """Return the stored analysis result, or None if unknown"""
+        if not self.is_valid_id(analysis_id):
+            return None
+        staged = self._pending.get(analysis_id)
+        if staged is not None:
+            return staged[0]
+        try:
+            with open(self.path(analysis_id, "analysis.json"), "rb") as f:
+                return loads(f.read())
+        except (OSError, ValueError):
+            pass
+        if self.shared is not None:
+            # Staged by another worker that has not written it yet
+            try:
+                return self.shared.cache_get(self._staged_key(analysis_id))
+            except sqlite3.Error:
+                pass
+        return None
+
+    def write_file(self, analysis_id, name, data):
+        """Write an extra file next to a stored artifact"""
+        directory = self.path(analysis_id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        return os.path.join(directory, name)
+
+    def image_path(self, analysis_id):
+        """Return the stored image path, or None if it has not been written"""
+        if not self.is_valid_id(analysis_id):
+            return None
+        path = self.path(analysis_id, "image.jpg")
+        return path if os.path.exists(path) else None
+
+    def stats(self):
+        count, total_bytes = len(self._index), self._total_bytes
+        if self.shared is not None:
+            try:
+                count, total_bytes = self.shared.artifact_totals()
+            except sqlite3.Error:
+                pass
+        return {
+            "artifacts": count,
+            "total_bytes": total_bytes,
+            "shared_index": self.shared is not None,
+            "pending_writes": len(self._pending),
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "max_count": self.max_count,
+            "pruned": self.pruned,
+            "write_errors": self.write_errors
+        }
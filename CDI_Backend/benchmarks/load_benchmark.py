@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+End-to-end Load Benchmark
+-------------------------
+Starts the mock KindWise/OpenRouter servers and the FastAPI backend as
+subprocesses, drives /analyze (or another analysis endpoint) at a fixed
+concurrency and reports throughput, latency percentiles and backend CPU and
+memory use. Nothing leaves the machine, so runs are comparable offline.
+
+Usage:
+    python load_benchmark.py --requests 200 --concurrency 16
+    python load_benchmark.py --requests 500 --concurrency 64 --kindwise-latency 1.0 --error-rate 0.05
+    python load_benchmark.py --backend-url http://127.0.0.1:8000   # drive an already running backend
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+from PIL import Image, ImageDraw
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_images(count, width, height, seed=7):
+    """Generate distinct synthetic leaf-like JPEGs of the given size"""
+    rng = random.Random(seed)
+    base = Image.new("RGB", (width, height), (40, 110, 35))
+    draw = ImageDraw.Draw(base)
+    for _ in range(400):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(10, max(11, width // 20))
+        draw.ellipse([x, y, x + radius, y + radius], fill=(rng.randrange(20, 120), rng.randrange(80, 200), rng.randrange(10, 80)))
+
+    images = []
+    for index in range(count):
+        image = base.copy()
+        # A small unique patch per image gives each one a different hash
+        ImageDraw.Draw(image).rectangle([0, 0, 32, 32], fill=(index % 256, (index // 256) % 256, 90))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ProcessSampler:
+    """Samples CPU time and resident memory of a process and its children"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.samples = []
+        self._task = None
+        try:
+            import psutil
+            self._psutil = psutil
+            self._errors = (OSError, ValueError, psutil.Error)
+        except ImportError:
+            self._psutil = None
+            self._errors = (OSError, IndexError, ValueError)
+
+    def _pids(self):
+        pids = [self.pid]
+        if self._psutil is not None:
+            try:
+                pids += [child.pid for child in self._psutil.Process(self.pid).children(recursive=True)]
+            except self._psutil.Error:
+                pass
+            return pids
+        # /proc fallback: walk the children lists of every thread
+        index = 0
+        while index < len(pids):
+            task_dir = f"/proc/{pids[index]}/task"
+            try:
+                for tid in os.listdir(task_dir):
+                    with open(f"{task_dir}/{tid}/children") as f:
+                        pids += [int(pid) for pid in f.read().split()]
+            except OSError:
+                pass
+            index += 1
+        return pids
+
+    def snapshot(self):
+        """Return (cpu_seconds, rss_bytes) summed over the process tree"""
+        cpu_seconds = 0.0
+        rss = 0
+        for pid in self._pids():
+            try:
+                if self._psutil is not None:
+                    process = self._psutil.Process(pid)
+                    times = process.cpu_times()
+                    cpu_seconds += times.user + times.system
+                    rss += process.memory_info().rss
+                else:
+                    with open(f"/proc/{pid}/stat") as f:
+                        fields = f.read().rsplit(")", 1)[1].split()
+                    ticks = os.sysconf("SC_CLK_TCK")
+                    cpu_seconds += (int(fields[11]) + int(fields[12])) / ticks
+                    rss += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+            except self._errors:
+                continue
+        return cpu_seconds, rss
+
+    async def _run(self):
+        while True:
+            cpu_seconds, rss = self.snapshot()
+            self.peak_rss = max(self.peak_rss, rss)
+            self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.start_cpu, _ = self.snapshot()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        end_cpu, rss = self.snapshot()
+        return {
+            "cpu_seconds": round(end_cpu - self.start_cpu, 3),
+            "peak_rss_mb": round(max(self.peak_rss, rss) / (1024 * 1024), 1),
+            "avg_rss_mb": round(sum(self.samples) / len(self.samples) / (1024 * 1024), 1) if self.samples else 0.0
+        }
+
+
+async def wait_until_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.time() < deadline:
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+async def drive_load(base_url, endpoint, images, total_requests, concurrency, timeout):
+    """Send total_requests uploads with at most `concurrency` in flight"""
+    latencies = []
+    statuses = {}
+    errors = {}
+    next_request = iter(range(total_requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for index in next_request:
+                image = images[index % len(images)]
+                started = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, files={"file": (f"bench_{index}.jpg", image, "image/jpeg")})
+                    await response.aread()
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                except httpx.HTTPError as e:
+                    name = type(e).__name__
+                    errors[name] = errors.get(name, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0
+        },
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "client_errors": errors
+    }
+
+
+def start_process(args, cwd, env, log_path):
+    log_file = open(log_path, "w")
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log_file, stderr=subprocess.STDOUT), log_file
+
+
+async def run_benchmark(options):
+    work_dir = tempfile.mkdtemp(prefix="cdi_bench_")
+    processes = []
+    backend_pid = None
+    base_url = options.backend_url
+
+    try:
+        if not base_url:
+            mock_port = free_port()
+            backend_port = free_port()
+
+            mock_process = start_process([
+                sys.executable, os.path.join(BENCHMARK_DIR, "mock_upstreams.py"),
+                "--port", str(mock_port),
+                "--kindwise-latency", str(options.kindwise_latency),
+                "--llm-latency", str(options.llm_latency),
+                "--jitter", str(options.jitter),
+                "--error-rate", str(options.error_rate),
+                "--seed", str(options.seed)
+            ], BENCHMARK_DIR, dict(os.environ), os.path.join(work_dir, "mock.log"))
+            processes.append(mock_process)
+            await wait_until_ready(f"http://127.0.0.1:{mock_port}/stats")
+
+            env = dict(os.environ)
+            env.update({
+                "KINDWISE_API_KEY": "benchmark",
+                "KINDWISE_API_URL": f"http://127.0.0.1:{mock_port}/api/v1/identification",
+                "OPENROUTER_API_KEY": "benchmark",
+                "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/api/v1",
+                "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+                "RELOAD": "False"
+            })
+            if options.no_cache:
+                env["DIAGNOSIS_CACHE_ENABLED"] = "False"
+                env["TREATMENT_CACHE_ENABLED"] = "False"
+            for assignment in options.backend_env:
+                key, _, value = assignment.partition("=")
+                env[key] = value
+
+            backend_process = start_process([
+                sys.executable, "-m", "uvicorn", "main_fastapi:app",
+                "--host", "127.0.0.1", "--port", str(backend_port), "--log-level", "warning"
+            ], BACKEND_DIR, env, os.path.join(work_dir, "backend.log"))
+            processes.append(backend_process)
+            backend_pid = backend_process[0].pid
+            base_url = f"http://127.0.0.1:{backend_port}"
+
+        await wait_until_ready(f"{base_url}/health")
+
+        print(f"Generating {options.unique_images} test images ({options.width}x{options.height})...")
+        images = make_images(options.unique_images, options.width, options.height, seed=options.seed)
+
+        if options.warmup:
+            await drive_load(base_url, options.endpoint, images[:1], options.warmup, 1, options.timeout)
+
+        sampler = ProcessSampler(backend_pid) if backend_pid else None
+        if sampler:
+            sampler.start()
+        results = await drive_load(base_url, options.endpoint, images, options.requests, options.concurrency, options.timeout)
+        if sampler:
+            resources = await sampler.stop()
+            resources["cpu_utilization_pct"] = round(100 * resources["cpu_seconds"] / results["elapsed_seconds"], 1)
+            results["backend_resources"] = resources
+
+        results["config"] = {
+            "endpoint": options.endpoint,
+            "unique_images": options.unique_images,
+            "image_size": f"{options.width}x{options.height}",
+            "kindwise_latency": options.kindwise_latency,
+            "llm_latency": options.llm_latency,
+            "error_rate": options.error_rate,
+            "cache": not options.no_cache,
+            "backend_env": options.backend_env
+        }
+        return results
+
+    finally:
+        for process, log_file in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log_file.close()
+        if processes:
+            print(f"Logs: {work_dir}")
+
+
+def print_report(results):
+    print("=" * 60)
+    print("CDI BACKEND LOAD BENCHMARK")
+    print("=" * 60)
+    print(f"Endpoint:      {results['config']['endpoint']}")
+    print(f"Requests:      {results['requests']} at concurrency {results['concurrency']}")
+    print(f"Elapsed:       {results['elapsed_seconds']}s")
+    print(f"Throughput:    {results['throughput_rps']} req/s")
+    latency = results["latency_ms"]
+    print(f"Latency (ms):  p50={latency['p50']}  p95={latency['p95']}  p99={latency['p99']}  max={latency['max']}")
+    print(f"Status codes:  {results['status_codes']}")
+    if results["client_errors"]:
+        print(f"Client errors: {results['client_errors']}")
+    resources = results.get("backend_resources")
+    if resources:
+        print(f"Backend CPU:   {resources['cpu_seconds']}s ({resources['cpu_utilization_pct']}% of one core)")
+        print(f"Backend RSS:   peak {resources['peak_rss_mb']} MB, average {resources['avg_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the CDI backend")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--endpoint", default="/analyze", help="Endpoint receiving the uploads")
+    parser.add_argument("--unique-images", type=int, default=50, help="Distinct images to cycle through (controls cache hits)")
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--kindwise-latency", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the diagnosis and treatment caches")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend environment variable")
+    parser.add_argument("--backend-url", help="Benchmark an already running backend instead of starting one")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential warm-up requests before measuring")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json-output", help="Also write the results to this JSON file")
+    options = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(options))
+    print_report(results)
+    if options.json_output:
+        with open(options.json_output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Mock Upstream APIs
+------------------
+Local stand-ins for the KindWise identification API and the OpenRouter
+chat-completions API, with configurable latency and error injection, so the
+backend can be benchmarked offline and reproducibly.
+
+Usage:
+    python mock_upstreams.py --port 9100 --kindwise-latency 0.8 --llm-latency 2.0 --error-rate 0.02
+
+Point the backend at it with:
+    KINDWISE_API_URL=http://127.0.0.1:9100/api/v1/identification
+    OPENROUTER_BASE_URL=http://127.0.0.1:9100/api/v1
+"""
+
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CROPS = [
+    ("Tomato", "Solanum lycopersicum"),
+    ("Maize", "Zea mays"),
+    ("Wheat", "Triticum aestivum"),
+    ("Rice", "Oryza sativa"),
+    ("Cassava", "Manihot esculenta")
+]
+
+DISEASES = ["Early blight", "Late blight", "Leaf rust", "Powdery mildew", "Root rot", "Fusarium wilt", "Leaf spot"]
+
+TREATMENT_TEXT = (
+    "1. Assessment: The plant shows symptoms consistent with the detected condition. "
+    "2. Treatment: Remove affected leaves, improve air circulation and apply a copper-based fungicide. "
+    "3. Care: Water at the base in the morning and mulch to limit soil splash. "
+    "4. Consultation: Contact an extension officer if symptoms spread within a week."
+)
+
+
+def create_app(kindwise_latency=0.5, llm_latency=1.5, jitter=0.2, error_rate=0.0,
+               token_interval=0.02, seed=42):
+    """Build the mock upstream app
+
+    Latencies are in seconds; ``jitter`` is the +/- fraction applied to them and
+    ``error_rate`` the fraction of calls answered with HTTP 500.
+    """
+    app = FastAPI(title="CDI Mock Upstreams")
+    rng = random.Random(seed)
+    stats = {"kindwise_calls": 0, "llm_calls": 0, "errors": 0}
+
+    def delay(base):
+        return max(0.0, base * (1 + rng.uniform(-jitter, jitter)))
+
+    def should_fail():
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return True
+        return False
+
+    @app.post("/api/v1/identification")
+    async def identification(request: Request):
+        body = await request.json()
+        stats["kindwise_calls"] += 1
+        await asyncio.sleep(delay(kindwise_latency))
+        if should_fail():
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        # Derive the answer from the image so identical images get identical results
+        image_seed = zlib.crc32(body["images"][0][-64:].encode("ascii")) if body.get("images") else 0
+        image_rng = random.Random(image_seed)
+        crop_name, scientific_name = image_rng.choice(CROPS)
+        disease_suggestions = []
+        for name in image_rng.sample(DISEASES, 2):
+            suggestion = {"id": name.lower().replace(" ", "_"), "name": name, "probability": round(image_rng.uniform(0.2, 0.95), 3)}
+            if body.get("similar_images"):
+                suggestion["similar_images"] = [
+                    {"id": f"{suggestion['id']}_{i}", "url": f"https://example.com/similar/{suggestion['id']}/{i}.jpg", "similarity": 0.8}
+                    for i in range(2)
+                ]
+            disease_suggestions.append(suggestion)
+
+        return JSONResponse({
+            "access_token": "mock",
+            "status": "COMPLETED",
+            "result": {
+                "is_plant": {"binary": True, "probability": 0.99},
+                "crop": {"suggestions": [{"id": crop_name.lower(), "name": crop_name, "scientific_name": scientific_name, "probability": round(image_rng.uniform(0.6, 0.99), 3)}]},
+                "disease": {"suggestions": disease_suggestions}
+            }
+        }, status_code=201)
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["llm_calls"] += 1
+        created = int(time.time())
+
+        if body.get("stream"):
+            # Time to first token, then tokens at a steady rate
+            await asyncio.sleep(delay(llm_latency) / 2)
+            if should_fail():
+                return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+
+            async def token_stream():
+                for word in TREATMENT_TEXT.split(" "):
+                    chunk = {
+                        "id": "mock-completion", "object": "chat.completion.chunk", "created": created,
+                        "model": body.get("model", "mock"),
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(token_interval)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(token_stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay(llm_latency))
+        if should_fail():
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        return {
+            "id": "mock-completion", "object": "chat.completion", "created": created,
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": TREATMENT_TEXT}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 150, "completion_tokens": 80, "total_tokens": 230}
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock KindWise and OpenRouter APIs for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--kindwise-latency", type=float, default=0.5, help="KindWise response time in seconds")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Chat completion response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction applied to latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 500")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app(
+        kindwise_latency=args.kindwise_latency,
+        llm_latency=args.llm_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        token_interval=args.token_interval,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
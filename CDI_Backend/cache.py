@@ -0,0 +1,172 @@
+"""
+Analysis Caches
+---------------
+LRU caches with TTL eviction for diagnosis and treatment results, with an
+optional on-disk tier that survives restarts
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from serialization import dumps, loads
+
+
+class LRUCache:
+    """In-memory LRU cache with per-entry time-to-live"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """JSON-file cache tier, one file per key, evicted by age and file count"""
+
+    def __init__(self, directory: str, max_entries: int = 10000, ttl: float = 86400):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                self.evictions += 1
+                return None
+            with open(path, "rb") as f:
+                return loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: Any):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(value))
+        os.replace(tmp_path, path)
+        self._writes += 1
+        # Listing the directory is comparatively expensive, so prune periodically
+        if self._writes % 50 == 0:
+            self.prune()
+
+    def prune(self):
+        """Remove expired entries and the oldest entries beyond max_entries"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime + self.ttl < now:
+                self._remove(path)
+            else:
+                entries.append((mtime, path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self.evictions += 1
+        except OSError:
+            pass
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+
+class TieredCache:
+    """Memory LRU in front of an optional persistent tier, with hit/miss counters"""
+
+    def __init__(self, name: str, memory: LRUCache, persistent=None, enabled: bool = True):
+        self.name = name
+        self.memory = memory
+        self.persistent = persistent
+        self.enabled = enabled
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.persistent is not None:
+            value = await asyncio.to_thread(self.persistent.get, key)
+            if value is not None:
+                self.hits += 1
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                await asyncio.to_thread(self.persistent.set, key, value)
+            except Exception as e:
+                print(f"{self.name} cache write error: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions
+        }
+        if self.persistent is not None:
+            stats["persistent_hits"] = self.persistent_hits
+            stats["persistent_evictions"] = self.persistent.evictions
+        return stats
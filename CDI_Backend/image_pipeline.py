@@ -0,0 +1,282 @@
+"""
+Image Preprocessing Pipeline
+----------------------------
+Decode, resize and JPEG re-encode steps for uploaded crop images, run in a
+worker pool so that CPU-heavy Pillow work stays off the event loop
+"""
+
+import io
+import os
+import time
+import asyncio
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Pillow and NumPy are imported on first use by load_image_libraries(): with a
+# process pool the web server itself never needs them, and pool workers
+# import them while warming up
+Image = None
+np = None
+
+PRESCREEN_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+
+def load_image_libraries():
+    """Import Pillow, and NumPy when it is installed, if not done yet"""
+    global Image, np
+    if Image is not None:
+        return
+    if PRESCREEN_AVAILABLE:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    from PIL import Image as pil_image
+    Image = pil_image
+
+
+class ImageQueueFull(Exception):
+    """Raised when too many images are already waiting for preprocessing"""
+
+
+def encode_jpeg(image, quality):
+    """Encode an RGB image as JPEG bytes"""
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format='JPEG', quality=quality)
+    return output_buffer.getvalue()
+
+
+def scale_to(image, longest_side):
+    """Downscale an image so its longest side is at most longest_side"""
+    if max(image.size) <= longest_side:
+        return image
+    ratio = longest_side / max(image.size)
+    new_size = tuple(max(1, int(dim * ratio)) for dim in image.size)
+    return image.resize(new_size, Image.LANCZOS)
+
+
+def prescreen_image(image, size=256, blur_threshold=60.0, min_brightness=35.0,
+                    max_brightness=230.0, min_plant_ratio=0.0):
+    """Score an RGB image for sharpness, exposure and plant content
+
+    Works on a copy downscaled to ``size`` pixels on the longest side:
+    sharpness is the variance of the Laplacian of the grayscale image,
+    brightness its mean (0-255) and plant_ratio the fraction of pixels with
+    a plant tissue colour: green by the excess-green index (2G - R - B), or
+    the yellow and brown hues (about 20-70 degrees) of chlorotic and necrotic
+    leaves. The no_plant check only runs when min_plant_ratio is above 0.
+    Returns (reasons, scores) where reasons lists the checks that failed.
+    """
+    small = image
+    if max(image.size) > size:
+        ratio = size / max(image.size)
+        small = image.resize(tuple(max(1, int(dim * ratio)) for dim in image.size), Image.BILINEAR, reducing_gap=2.0)
+    rgb = np.asarray(small, dtype=np.float32)
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    gray = 0.299 * red + 0.587 * green + 0.114 * blue
+    leafy = 2 * green - red - blue > 20
+    # Red is the largest channel and blue the smallest; (G - B) >= (R - B) / 3
+    # keeps hues from about 20 degrees up, leaving out reds and pinks
+    yellow_brown = ((red >= green) & (green > blue) & (red - blue > 25)
+                    & (3 * (green - blue) >= red - blue))
+
+    scores = {
+        'brightness': round(float(gray.mean()), 1),
+        'plant_ratio': round(float(np.mean(leafy | yellow_brown)), 3)
+    }
+    if min(gray.shape) >= 3:
+        laplacian = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+                     - 4 * gray[1:-1, 1:-1])
+        scores['sharpness'] = round(float(laplacian.var()), 1)
+
+    reasons = []
+    if scores['brightness'] < min_brightness:
+        reasons.append('too_dark')
+    elif scores['brightness'] > max_brightness:
+        reasons.append('overexposed')
+    elif scores.get('sharpness', blur_threshold) < blur_threshold:
+        # Bad exposure flattens edges too, so sharpness is only judged on well-exposed photos
+        reasons.append('blurry')
+    if min_plant_ratio > 0 and scores['plant_ratio'] < min_plant_ratio:
+        reasons.append('no_plant')
+    return reasons, scores
+
+
+def encode_within_budget(image, max_bytes, max_quality, min_quality, min_size):
+    """Encode at the highest quality and resolution whose JPEG fits max_bytes
+
+    Binary-searches quality between min_quality and max_quality. When even
+    min_quality is too large, the image is downscaled in proportion to the
+    overshoot (never below min_size on the longest side) and searched again.
+    Returns (jpeg_bytes, image, quality, attempts); the result may still
+    exceed the budget once min_size and min_quality are both reached.
+    """
+    attempts = 0
+    source = image
+    while True:
+        best = None
+        floor_bytes = None
+        # Most images already fit, so probe max_quality first, then bisect
+        low, high = min_quality, max_quality
+        quality = max_quality
+        while low <= high:
+            attempts += 1
+            candidate = encode_jpeg(image, quality)
+            if len(candidate) <= max_bytes:
+                best = (candidate, quality)
+                low = quality + 1
+            else:
+                if quality == min_quality:
+                    floor_bytes = candidate
+                high = quality - 1
+            quality = (low + high) // 2
+        if best is not None:
+            return best[0], image, best[1], attempts
+
+        longest_side = max(image.size)
+        if longest_side <= min_size:
+            return floor_bytes, image, min_quality, attempts
+        # JPEG size grows roughly with pixel count, so scale both sides by the square root
+        ratio = min(0.9, (max_bytes / len(floor_bytes)) ** 0.5 * 0.95)
+        image = scale_to(source, max(min_size, int(longest_side * ratio)))
+
+
+def preprocess_image(image_bytes, max_image_size, jpeg_quality, target_bytes=0, min_quality=60, min_size=512,
+                     prescreen=None):
+    """Normalize an uploaded image to an RGB JPEG
+
+    With target_bytes set, resolution and quality are chosen automatically so
+    that its base64 form stays within target_bytes, with jpeg_quality as
+    the starting quality and min_quality as the quality floor. Otherwise the
+    image is encoded once at jpeg_quality.
+
+    With prescreen set to a dict of prescreen_image() thresholds (and NumPy
+    installed), the result also carries the pre-screen reasons and scores.
+
+    Returns a dict with the JPEG bytes, the chosen quality and per-stage
+    timings in milliseconds. Base64 encoding happens later, while the upstream
+    request body is sent. Runs inside a worker, so it only takes and returns
+    picklable values.
+    """
+    timings = {}
+    result = {}
+    attempts = 1
+    quality = jpeg_quality
+
+    load_image_libraries()
+    try:
+        started = time.perf_counter()
+        image = Image.open(io.BytesIO(image_bytes))
+        if target_bytes:
+            # Let the JPEG decoder skip detail that the resize would discard
+            image.draft('RGB', (max_image_size, max_image_size))
+        image.load()
+        timings['decode_ms'] = (time.perf_counter() - started) * 1000
+
+        # Resize if too large
+        started = time.perf_counter()
+        resized = scale_to(image, max_image_size)
+        if resized is not image:
+            # Free the full-size pixels before encoding
+            image.close()
+        image = resized
+        timings['resize_ms'] = (time.perf_counter() - started) * 1000
+
+        image = image.convert('RGB')
+        if prescreen is not None and np is not None:
+            started = time.perf_counter()
+            reasons, scores = prescreen_image(image, **prescreen)
+            result['prescreen'] = {'reasons': reasons, 'scores': scores}
+            timings['prescreen_ms'] = (time.perf_counter() - started) * 1000
+
+        # Save as JPEG
+        started = time.perf_counter()
+        if target_bytes:
+            # base64 turns every 3 bytes into 4 characters
+            jpeg_bytes, image, quality, attempts = encode_within_budget(
+                image, target_bytes * 3 // 4, jpeg_quality, min(min_quality, jpeg_quality), min_size
+            )
+        else:
+            jpeg_bytes = encode_jpeg(image, jpeg_quality)
+        timings['encode_ms'] = (time.perf_counter() - started) * 1000
+    except Exception as img_err:
+        # Pillow exceptions do not always survive pickling back from a process
+        raise ValueError(str(img_err))
+
+    result.update({
+        'jpeg_bytes': jpeg_bytes,
+        'width': image.size[0],
+        'height': image.size[1],
+        'jpeg_quality': quality,
+        'encode_attempts': attempts,
+        'timings': {stage: round(ms, 2) for stage, ms in timings.items()}
+    })
+    return result
+
+
+def warm_up_worker():
+    """Decode, pre-screen and encode a small image so the first upload does not pay for imports"""
+    load_image_libraries()
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (60, 140, 60)).save(buffer, format='JPEG')
+    preprocess_image(buffer.getvalue(), 64, 85, prescreen={})
+    return os.getpid()
+
+
+class ImagePool:
+    """Process or thread pool for image preprocessing with a bounded queue"""
+
+    def __init__(self, kind="process", workers=None, queue_limit=32):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    def start(self):
+        if self._executor is not None or self.kind == "inline":
+            return
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warm_up(self):
+        """Start the pool and run warm_up_worker on (normally) every worker"""
+        if self.kind == "inline":
+            warm_up_worker()
+            return
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, warm_up_worker) for _ in range(self.workers)))
+
+    async def run(self, func, *args):
+        """Run func(*args) in the pool, rejecting work beyond the queue limit"""
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise ImageQueueFull(f"Image preprocessing queue is full ({self.queue_limit} pending)")
+
+        self.pending += 1
+        try:
+            if self.kind == "inline":
+                return func(*args)
+            self.start()
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self.pending,
+            "rejected": self.rejected
+        }
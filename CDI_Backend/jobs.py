@@ -0,0 +1,245 @@
+"""
+Analysis Job Queue
+------------------
+Bounded priority queue of analysis jobs processed by background workers,
+with finished results kept for a limited time and waiting uploads spooled
+to disk
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import itertools
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds the maximum number of waiting jobs"""
+
+
+class UploadSpool:
+    """Uploads of queued jobs, kept on disk so that waiting jobs hold no image bytes
+
+    All methods are blocking; call them through asyncio.to_thread.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, data):
+        """Store an upload and return its path"""
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.upload")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def sweep(self, max_age):
+        """Remove uploads older than max_age seconds, e.g. left by a worker that died; return the count"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class JobQueue:
+    """Priority job queue drained by a fixed pool of asyncio workers
+
+    ``handler`` is an async callable taking the job payload and returning a
+    JSON-serializable result. Higher ``priority`` values run first; jobs with
+    equal priority run in submission order.
+
+    ``records`` is an optional shared cache tier (e.g. shared_state.SharedCache)
+    that public job records are copied to, so that any worker process can
+    answer status requests for jobs queued in another.
+
+    With ``spool`` (an UploadSpool), ``payload['upload_path']`` names a
+    spooled upload that is removed once the job has run or expired. Jobs
+    still queued after ``result_ttl`` seconds expire as well.
+
+    ``max_depth`` counts jobs still waiting to run. An expired job leaves its
+    entry in the priority queue until a worker skips it, so the depth comes
+    from the job records rather than the queue size.
+    """
+
+    def __init__(self, handler, workers=4, max_depth=100, result_ttl=3600, records=None, spool=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.records = records
+        self.spool = spool
+        self.jobs = {}
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.queued = 0
+        self._queue = None
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._publish_lock = asyncio.Lock()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload, priority=0):
+        """Queue a job and return its public record"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "priority": priority,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        if self.queued >= self.max_depth:
+            self.rejected += 1
+            raise JobQueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+        self._queue.put_nowait((-priority, next(self._sequence), job_id))
+        self.jobs[job_id] = (job, payload)
+        self.queued += 1
+        return self.view(job_id)
+
+    def view(self, job_id):
+        """Return the public record of a job, or None if unknown or expired"""
+        entry = self.jobs.get(job_id)
+        if entry is None:
+            return None
+        job = dict(entry[0])
+        if job["status"] == "queued":
+            job["queue_depth"] = self.queued
+        return job
+
+    async def publish(self, job_id):
+        """Copy the current public record of a job to the shared records"""
+        if self.records is None:
+            return
+        # Publishing in order keeps an earlier status from overwriting a later one
+        async with self._publish_lock:
+            job = self.view(job_id)
+            if job is None:
+                return
+            try:
+                await asyncio.to_thread(self.records.set, job_id, job)
+            except Exception as e:
+                print(f"Job record write error: {str(e)}")
+
+    async def lookup(self, job_id):
+        """Like view(), falling back to records published by other workers"""
+        job = self.view(job_id)
+        if job is None and self.records is not None:
+            job = await asyncio.to_thread(self.records.get, job_id)
+        return job
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                entry = self.jobs.get(job_id)
+                if entry is None:
+                    # Expired while it was waiting
+                    continue
+                job, payload = entry
+                self.queued -= 1
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                # Only the handler holds the payload from here on
+                self.jobs[job_id] = (job, None)
+                await self.publish(job_id)
+                try:
+                    job["result"] = await self.handler(payload)
+                    job["status"] = "completed"
+                    self.completed += 1
+                except Exception as e:
+                    job["status"] = "failed"
+                    job["error"] = getattr(e, "detail", None) or str(e)
+                    self.failed += 1
+                finally:
+                    await self._discard([payload])
+                job["finished_at"] = time.time()
+                await self.publish(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _discard(self, payloads):
+        """Remove the spooled uploads of payloads that are no longer needed"""
+        if self.spool is None:
+            return
+        paths = [payload["upload_path"] for payload in payloads if payload and payload.get("upload_path")]
+        for path in paths:
+            await asyncio.to_thread(self.spool.discard, path)
+
+    async def _sweeper(self):
+        while True:
+            await self._discard(self.expire())
+            if self.spool is not None:
+                # Uploads of jobs queued by a worker that is gone
+                await asyncio.to_thread(self.spool.sweep, self.result_ttl)
+            await asyncio.sleep(min(60, max(1, self.result_ttl / 4)))
+
+    def expire(self):
+        """Drop finished jobs, and jobs still queued, older than result_ttl; return their payloads
+
+        A queued job that expires is skipped when a worker reaches it.
+        """
+        cutoff = time.time() - self.result_ttl
+
+        def stale(job):
+            if job["finished_at"] is not None:
+                return job["finished_at"] < cutoff
+            return job["status"] == "queued" and job["created_at"] < cutoff
+
+        expired = [job_id for job_id, (job, _) in self.jobs.items() if stale(job)]
+        self.queued -= sum(1 for job_id in expired if self.jobs[job_id][0]["status"] == "queued")
+        payloads = [self.jobs.pop(job_id)[1] for job_id in expired]
+        self.expired += len(expired)
+        return payloads
+
+    def stats(self):
+        statuses = {}
+        for job, _ in self.jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "queue_depth": self.queued,
+            "jobs": statuses,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired
+        }
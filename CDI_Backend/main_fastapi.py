@@ -4,29 +4,75 @@ FastAPI Crop Disease Identification API
 A REST API for crop disease identification using KindWise API
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from startup_timing import process_timer
+
+# Cold start timings, reported once the worker has warmed up and served its
+# first request. openai, Pillow and NumPy are imported lazily, in the
+# background after startup, and uvicorn only when run as a script.
+STARTUP = process_timer()
+
+with STARTUP.importing("fastapi"):
+    from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
+    from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.middleware.cors import CORSMiddleware
 import os
 import base64
-import requests
-import json
-from PIL import Image
-import io
+import hashlib
+import time
 import tempfile
-from typing import Optional
+from typing import List, Optional
 import shutil
 import subprocess
 import sys
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+with STARTUP.importing("httpx"):
+    import httpx
+with STARTUP.importing("dotenv"):
+    from dotenv import load_dotenv
+# Application modules are timed one by one; serialization and metrics come
+# first because the others import them
+with STARTUP.importing("serialization"):
+    from serialization import JSON_ENCODER, FastJSONResponse, dumps
+with STARTUP.importing("metrics"):
+    from metrics import (
+        REGISTRY, STAGE_SECONDS, REQUESTS_TOTAL, REQUEST_SECONDS, REQUESTS_IN_FLIGHT,
+        UPSTREAM_IN_FLIGHT, UPSTREAM_ERRORS, TREATMENT_FALLBACKS, CACHE_LOOKUPS, CACHE_ENTRIES, QUEUE_DEPTH,
+        CIRCUIT_STATE, HEDGED_REQUESTS, PRESCREEN_FLAGS, STARTUP_SECONDS
+    )
+with STARTUP.importing("cache"):
+    from cache import LRUCache, DiskCache, TieredCache
+with STARTUP.importing("shared_state"):
+    from shared_state import SharedState, SharedCache, SharedSemaphore
+with STARTUP.importing("image_pipeline"):
+    from image_pipeline import ImagePool, ImageQueueFull, preprocess_image, PRESCREEN_AVAILABLE
+with STARTUP.importing("jobs"):
+    from jobs import JobQueue, JobQueueFull, UploadSpool
+with STARTUP.importing("artifacts"):
+    from artifacts import ArtifactStore
+with STARTUP.importing("singleflight"):
+    from singleflight import SingleFlight
+with STARTUP.importing("resilience"):
+    from resilience import CircuitBreaker, deadline_after, time_left
+with STARTUP.importing("treatment_rules"):
+    from treatment_rules import TreatmentRuleBook
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Crop Disease Identification API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    """Worker startup and shutdown; see start_worker() and stop_worker()"""
+    await start_worker()
+    try:
+        yield
+    finally:
+        await stop_worker()
+
+app = FastAPI(title="Crop Disease Identification API", version="1.0.0", default_response_class=FastJSONResponse,
+              lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -37,6 +83,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Health checks and scrapes do not count as the first request in the startup report
+PROBE_PATHS = {"/health", "/ready", "/metrics"}
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests by route and status and track requests in flight"""
+    started = time.perf_counter()
+    status = 500
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        # Use the route template so ids in paths do not explode label cardinality
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUESTS_TOTAL.inc(method=request.method, path=path, status=status)
+        duration = time.perf_counter() - started
+        REQUEST_SECONDS.observe(duration, method=request.method, path=path)
+        if path not in PROBE_PATHS and STARTUP.mark_first_request(path, duration * 1000):
+            print(STARTUP.summary())
+
+# Upload endpoints, whose whole body can be checked against MAX_UPLOAD_MB per
+# image: one image, or up to BATCH_MAX_FILES for the batch endpoints
+SINGLE_UPLOAD_PATHS = {"/analyze", "/analyze/stream", "/jobs"}
+BATCH_UPLOAD_PATHS = {"/analyze/batch", "/analyze/batch/stream"}
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Answer 413 from Content-Length before the multipart body is received"""
+    path = request.url.path
+    if request.method == "POST" and (path in SINGLE_UPLOAD_PATHS or path in BATCH_UPLOAD_PATHS):
+        try:
+            content_length = int(request.headers.get("content-length", "0"))
+        except ValueError:
+            content_length = 0
+        images = BATCH_MAX_FILES if path in BATCH_UPLOAD_PATHS else 1
+        # Allow for the multipart framing around each image
+        if content_length > images * (MAX_UPLOAD_MB * 1024 * 1024 + 64 * 1024):
+            if images > 1:
+                detail = f"Batch is too large (maximum {BATCH_MAX_FILES} images of {MAX_UPLOAD_MB} MB)"
+            else:
+                detail = f"Image is too large (maximum {MAX_UPLOAD_MB} MB)"
+            return JSONResponse(status_code=413, content={"detail": detail})
+    return await call_next(request)
+
 # API Configuration from environment variables
 API_URL = os.getenv("KINDWISE_API_URL", "https://crop.kindwise.com/api/v1/identification")
 API_KEY = os.getenv("KINDWISE_API_KEY")
@@ -51,6 +145,103 @@ UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", "1024"))
 JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "95"))
 
+# Local pre-screen for blurry, badly exposed or non-plant photos (off, warn or reject)
+PRESCREEN_MODE = os.getenv("PRESCREEN_MODE", "warn").lower()
+PRESCREEN_SIZE = int(os.getenv("PRESCREEN_SIZE", "256"))
+PRESCREEN_BLUR_THRESHOLD = float(os.getenv("PRESCREEN_BLUR_THRESHOLD", "60"))
+PRESCREEN_MIN_BRIGHTNESS = float(os.getenv("PRESCREEN_MIN_BRIGHTNESS", "35"))
+PRESCREEN_MAX_BRIGHTNESS = float(os.getenv("PRESCREEN_MAX_BRIGHTNESS", "230"))
+# Off (0) unless set: colour alone can mistake fruit or odd backgrounds for "no plant"
+PRESCREEN_MIN_PLANT_RATIO = float(os.getenv("PRESCREEN_MIN_PLANT_RATIO", "0"))
+
+# Uploads larger than this are rejected with 413 while they are being read
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "20"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Input bytes base64-encoded per chunk of the KindWise request body (a multiple of 3)
+KINDWISE_BODY_CHUNK = 3 * 16384
+
+# Adaptive encoding: pick quality and resolution to fit the KindWise payload budget
+IMAGE_ENCODING_MODE = os.getenv("IMAGE_ENCODING_MODE", "fixed").lower()
+IMAGE_TARGET_BYTES = int(os.getenv("IMAGE_TARGET_BYTES", "300000"))
+IMAGE_MIN_QUALITY = int(os.getenv("IMAGE_MIN_QUALITY", "70"))
+IMAGE_MIN_SIZE = int(os.getenv("IMAGE_MIN_SIZE", "640"))
+
+# Upstream HTTP client settings (shared connection pool)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# DeepSeek call limits
+DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8"))
+DEEPSEEK_QUEUE_TIMEOUT = float(os.getenv("DEEPSEEK_QUEUE_TIMEOUT", "2"))
+DEEPSEEK_TIMEOUT = float(os.getenv("DEEPSEEK_TIMEOUT", "20"))
+# Start a backup DeepSeek request when the first is slower than this (0 = off)
+DEEPSEEK_HEDGE_DELAY = float(os.getenv("DEEPSEEK_HEDGE_DELAY", "0"))
+
+# End-to-end latency budget per analysis (0 = unlimited); DeepSeek is skipped
+# in favour of basic recommendations when less than DEEPSEEK_MIN_BUDGET is left
+ANALYZE_BUDGET = float(os.getenv("ANALYZE_BUDGET", "40"))
+DEEPSEEK_MIN_BUDGET = float(os.getenv("DEEPSEEK_MIN_BUDGET", "2"))
+
+# Rule table for basic treatment recommendations, reloaded when the file changes
+TREATMENT_RULES_FILE = os.getenv("TREATMENT_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "treatment_rules.json"))
+TREATMENT_RULES_RELOAD_INTERVAL = float(os.getenv("TREATMENT_RULES_RELOAD_INTERVAL", "5"))
+
+# Circuit breakers: stop calling an upstream after consecutive failures
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Diagnosis cache keyed by the hash of the normalized JPEG
+DIAGNOSIS_CACHE_ENABLED = os.getenv("DIAGNOSIS_CACHE_ENABLED", "True").lower() == "true"
+DIAGNOSIS_CACHE_MAX_ENTRIES = int(os.getenv("DIAGNOSIS_CACHE_MAX_ENTRIES", "512"))
+DIAGNOSIS_CACHE_TTL = float(os.getenv("DIAGNOSIS_CACHE_TTL", "86400"))
+DIAGNOSIS_CACHE_DIR = os.getenv("DIAGNOSIS_CACHE_DIR", "")
+DIAGNOSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("DIAGNOSIS_CACHE_DISK_MAX_ENTRIES", "5000"))
+
+# Treatment cache keyed by the normalized crop/disease set
+TREATMENT_CACHE_ENABLED = os.getenv("TREATMENT_CACHE_ENABLED", "True").lower() == "true"
+TREATMENT_CACHE_MAX_ENTRIES = int(os.getenv("TREATMENT_CACHE_MAX_ENTRIES", "1024"))
+TREATMENT_CACHE_TTL = float(os.getenv("TREATMENT_CACHE_TTL", "604800"))
+
+# Image preprocessing pool ("process", "thread" or "inline")
+IMAGE_POOL_KIND = os.getenv("IMAGE_POOL_KIND", "process").lower()
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", "0")) or None
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", "32"))
+
+# Batch analysis limits
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Background job queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "100"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+
+# Artifact retention under UPLOAD_DIR/analyses
+ARTIFACT_MAX_MB = int(os.getenv("ARTIFACT_MAX_MB", "500"))
+ARTIFACT_MAX_AGE = float(os.getenv("ARTIFACT_MAX_AGE", "604800"))
+ARTIFACT_MAX_COUNT = int(os.getenv("ARTIFACT_MAX_COUNT", "10000"))
+
+# Request coalescing: identical concurrent analyses share one upstream call
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "True").lower() == "true"
+
+# Serving mode: "production" runs WORKERS processes (default one per CPU core)
+# without auto-reload. Several workers share caches, upstream call leases and
+# job records through SHARED_STATE_DB, a SQLite file in WAL mode.
+SERVER_MODE = os.getenv("SERVER_MODE", "development").lower()
+WORKERS = int(os.getenv("WORKERS", "0")) or ((os.cpu_count() or 1) if SERVER_MODE == "production" else 1)
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", os.path.join(UPLOAD_DIR, "shared_state.db") if WORKERS > 1 else "")
+SHARED_LEASE_TTL = float(os.getenv("SHARED_LEASE_TTL", "60"))
+SHARED_POLL_INTERVAL = float(os.getenv("SHARED_POLL_INTERVAL", "0.05"))
+WORKER_HEARTBEAT_INTERVAL = 5
+
+# Worker processes split the cores between their image pools
+if IMAGE_POOL_WORKERS is None and WORKERS > 1:
+    IMAGE_POOL_WORKERS = max(1, (os.cpu_count() or 1) // WORKERS)
+
 # Validate required environment variables
 if not API_KEY:
     print("WARNING: KINDWISE_API_KEY not found in environment variables!")
@@ -58,128 +249,537 @@ if not API_KEY:
 if not OPENROUTER_API_KEY:
     print("WARNING: OPENROUTER_API_KEY not found in environment variables!")
 
-# DeepSeek Configuration
-if OPENROUTER_API_KEY:
-    DEEPSEEK_CLIENT = OpenAI(
-        api_key=OPENROUTER_API_KEY,
-        base_url=OPENROUTER_BASE_URL,
-        default_headers={
-            "HTTP-Referer": "http://localhost:8000",
-            "X-Title": "CDI Crop Disease Identification API"
-        }
-    )
-else:
-    DEEPSEEK_CLIENT = None
+if PRESCREEN_MODE != "off" and not PRESCREEN_AVAILABLE:
+    print("WARNING: NumPy is not installed, photo pre-screening is disabled")
+
+# Thresholds passed to the image workers, or None when pre-screening is off
+PRESCREEN_SETTINGS = {
+    'size': PRESCREEN_SIZE,
+    'blur_threshold': PRESCREEN_BLUR_THRESHOLD,
+    'min_brightness': PRESCREEN_MIN_BRIGHTNESS,
+    'max_brightness': PRESCREEN_MAX_BRIGHTNESS,
+    'min_plant_ratio': PRESCREEN_MIN_PLANT_RATIO
+} if PRESCREEN_MODE != "off" else None
+
+# What users are told for each pre-screen reason
+PRESCREEN_ADVICE = {
+    'blurry': "The photo is blurry. Hold the camera steady and tap on the leaf to focus.",
+    'too_dark': "The photo is too dark. Take it in daylight or with more light on the plant.",
+    'overexposed': "The photo is overexposed. Avoid direct sun or flash on the leaf.",
+    'no_plant': "Little or no plant is visible. Fill the frame with the affected leaves."
+}
+PRESCREEN_COUNTS = {'checked': 0, 'rejected': 0, 'warned': 0, 'reasons': {}}
+
+# DeepSeek Configuration: the client is created on first use (normally by the
+# background warm-up), since importing openai dominates a cold start
+DEEPSEEK_CLIENT = None
+DEEPSEEK_CLIENT_LOCK = threading.Lock()
+
+def get_deepseek_client():
+    """Return the DeepSeek client, creating it if needed (None without an API key)"""
+    global DEEPSEEK_CLIENT
+    if DEEPSEEK_CLIENT is None and OPENROUTER_API_KEY:
+        with DEEPSEEK_CLIENT_LOCK:
+            if DEEPSEEK_CLIENT is None:
+                with STARTUP.importing("openai", lazy=True):
+                    from openai import AsyncOpenAI
+                DEEPSEEK_CLIENT = AsyncOpenAI(
+                    api_key=OPENROUTER_API_KEY,
+                    base_url=OPENROUTER_BASE_URL,
+                    timeout=DEEPSEEK_TIMEOUT,
+                    max_retries=0,
+                    default_headers={
+                        "HTTP-Referer": "http://localhost:8000",
+                        "X-Title": "CDI Crop Disease Identification API"
+                    }
+                )
+    return DEEPSEEK_CLIENT
+
+async def deepseek_client():
+    """get_deepseek_client() for request handlers
+    
+    While the warm-up is still importing openai, creating the client waits on
+    its lock; that wait happens in a thread so other requests keep running.
+    """
+    if DEEPSEEK_CLIENT is not None or not OPENROUTER_API_KEY:
+        return DEEPSEEK_CLIENT
+    return await asyncio.to_thread(get_deepseek_client)
+
+if not OPENROUTER_API_KEY:
     print("WARNING: DeepSeek client not initialized due to missing API key")
 
+# Basic treatment recommendations used whenever DeepSeek is unavailable
+TREATMENT_RULES = TreatmentRuleBook(TREATMENT_RULES_FILE, reload_interval=TREATMENT_RULES_RELOAD_INTERVAL)
+
+# While a breaker is open, KindWise requests fail fast with 503 and DeepSeek
+# is replaced by basic recommendations
+KINDWISE_BREAKER = CircuitBreaker("kindwise", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+DEEPSEEK_BREAKER = CircuitBreaker("deepseek", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
 # Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-async def get_deepseek_treatment(crops, diseases):
-    """Get treatment recommendations from DeepSeek AI"""
-    if not DEEPSEEK_CLIENT:
+# State shared by the worker processes of this node (None when not configured)
+SHARED_STATE = SharedState(SHARED_STATE_DB) if SHARED_STATE_DB else None
+
+# Cap on in-flight DeepSeek calls, counted across all workers when state is
+# shared. Slots of a worker that dies are freed once their lease expires,
+# which has to outlast the longest call.
+if SHARED_STATE is not None:
+    DEEPSEEK_SEMAPHORE = SharedSemaphore(
+        SHARED_STATE, "deepseek-slot", DEEPSEEK_MAX_CONCURRENCY,
+        ttl=DEEPSEEK_TIMEOUT + SHARED_LEASE_TTL,
+        poll_interval=SHARED_POLL_INTERVAL,
+        fallback_limit=max(1, DEEPSEEK_MAX_CONCURRENCY // WORKERS)
+    )
+else:
+    DEEPSEEK_SEMAPHORE = asyncio.Semaphore(DEEPSEEK_MAX_CONCURRENCY)
+
+async def try_acquire_deepseek_slot():
+    """Take a DeepSeek slot only if one is free right now"""
+    if SHARED_STATE is not None:
+        return await DEEPSEEK_SEMAPHORE.try_acquire()
+    if DEEPSEEK_SEMAPHORE.locked():
+        return False
+    await DEEPSEEK_SEMAPHORE.acquire()
+    return True
+
+# Per-analysis result and image files, bounded by size, count and age
+ARTIFACTS = ArtifactStore(
+    os.path.join(UPLOAD_DIR, "analyses"),
+    max_bytes=ARTIFACT_MAX_MB * 1024 * 1024,
+    max_age=ARTIFACT_MAX_AGE,
+    max_count=ARTIFACT_MAX_COUNT,
+    shared=SHARED_STATE,
+    poll_interval=SHARED_POLL_INTERVAL
+)
+
+# Diagnosis cache: in-memory LRU, plus the shared tier when several workers
+# run, or an on-disk tier when DIAGNOSIS_CACHE_DIR is set
+if SHARED_STATE is not None:
+    DIAGNOSIS_CACHE_TIER = SharedCache(SHARED_STATE, "diagnosis", max_entries=DIAGNOSIS_CACHE_DISK_MAX_ENTRIES, ttl=DIAGNOSIS_CACHE_TTL)
+elif DIAGNOSIS_CACHE_DIR:
+    DIAGNOSIS_CACHE_TIER = DiskCache(DIAGNOSIS_CACHE_DIR, max_entries=DIAGNOSIS_CACHE_DISK_MAX_ENTRIES, ttl=DIAGNOSIS_CACHE_TTL)
+else:
+    DIAGNOSIS_CACHE_TIER = None
+DIAGNOSIS_CACHE = TieredCache(
+    "diagnosis",
+    LRUCache(max_entries=DIAGNOSIS_CACHE_MAX_ENTRIES, ttl=DIAGNOSIS_CACHE_TTL),
+    DIAGNOSIS_CACHE_TIER,
+    enabled=DIAGNOSIS_CACHE_ENABLED
+)
+
+# Treatment cache: many different photos share the same diagnosis
+TREATMENT_CACHE = TieredCache(
+    "treatment",
+    LRUCache(max_entries=TREATMENT_CACHE_MAX_ENTRIES, ttl=TREATMENT_CACHE_TTL),
+    SharedCache(SHARED_STATE, "treatment", max_entries=TREATMENT_CACHE_MAX_ENTRIES, ttl=TREATMENT_CACHE_TTL) if SHARED_STATE is not None else None,
+    enabled=TREATMENT_CACHE_ENABLED
+)
+
+# In-flight KindWise calls by image hash and DeepSeek calls by diagnosis, so a
+# double-tapped upload or a client retry does not repeat the upstream calls,
+# even when the duplicates land on different workers
+KINDWISE_FLIGHTS = SingleFlight(
+    "kindwise", enabled=COALESCE_ENABLED, shared=SHARED_STATE,
+    lease_ttl=SHARED_LEASE_TTL, poll_interval=SHARED_POLL_INTERVAL
+)
+TREATMENT_FLIGHTS = SingleFlight(
+    "deepseek", enabled=COALESCE_ENABLED, shared=SHARED_STATE,
+    lease_ttl=SHARED_LEASE_TTL, poll_interval=SHARED_POLL_INTERVAL
+)
+
+# Worker pool that keeps Pillow work off the event loop
+IMAGE_POOL = ImagePool(kind=IMAGE_POOL_KIND, workers=IMAGE_POOL_WORKERS, queue_limit=IMAGE_QUEUE_LIMIT)
+
+# Shared async HTTP client, created on startup so that every request reuses
+# the same keep-alive connections and TLS sessions to the upstream APIs
+HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+HTTP_CLIENT_LOCK = threading.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream HTTP client, creating it if needed"""
+    global HTTP_CLIENT
+    with HTTP_CLIENT_LOCK:
+        if HTTP_CLIENT is None or HTTP_CLIENT.is_closed:
+            HTTP_CLIENT = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    HTTP_READ_TIMEOUT,
+                    connect=HTTP_CONNECT_TIMEOUT,
+                    pool=HTTP_POOL_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+        return HTTP_CLIENT
+
+async def http_client() -> httpx.AsyncClient:
+    """get_http_client() for request handlers, creating the client off the event loop if needed"""
+    client = HTTP_CLIENT
+    if client is not None and not client.is_closed:
+        return client
+    return await asyncio.to_thread(get_http_client)
+
+# Set once this worker has warmed up; see /ready
+WORKER_READY = asyncio.Event()
+WORKER_TASKS = []
+
+def warm_up_clients():
+    """Create the upstream clients, which loads TLS certificates and imports openai"""
+    get_http_client()
+    get_deepseek_client()
+
+async def warm_up_worker():
+    """Warm the clients and image pool, then report this worker ready and keep its heartbeat fresh"""
+    started = time.perf_counter()
+    # Runs as a background task, so the server accepts connections meanwhile
+    results = await asyncio.gather(
+        asyncio.to_thread(warm_up_clients),
+        IMAGE_POOL.warm_up(),
+        return_exceptions=True
+    )
+    for step, result in zip(("Client", "Image pool"), results):
+        if isinstance(result, Exception):
+            print(f"{step} warm-up failed: {str(result)}")
+    WORKER_READY.set()
+    STARTUP.mark_ready()
+    print(f"Worker {os.getpid()} ready after {time.perf_counter() - started:.2f}s warm-up")
+    print(STARTUP.summary())
+    
+    if SHARED_STATE is None:
+        return
+    await asyncio.to_thread(SHARED_STATE.mark_ready)
+    while True:
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+        try:
+            await asyncio.to_thread(SHARED_STATE.heartbeat)
+        except Exception as e:
+            print(f"Worker heartbeat error: {str(e)}")
+
+async def start_worker():
+    """Start the image pool and job workers, and warm up in the background"""
+    IMAGE_POOL.start()
+    JOB_QUEUE.start()
+    if SHARED_STATE is not None:
+        await asyncio.to_thread(SHARED_STATE.register_worker)
+    WORKER_TASKS.append(asyncio.create_task(warm_up_worker()))
+
+async def stop_worker():
+    """Close pooled upstream connections and image workers on shutdown"""
+    global HTTP_CLIENT
+    for task in WORKER_TASKS:
+        task.cancel()
+    if SHARED_STATE is not None:
+        await asyncio.to_thread(SHARED_STATE.unregister_worker)
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.aclose()
+        HTTP_CLIENT = None
+    await JOB_QUEUE.stop()
+    await ARTIFACTS.drain()
+    IMAGE_POOL.shutdown()
+
+def build_treatment_prompt(crops, diseases):
+    """Build the DeepSeek prompt for a set of crop analysis results"""
+    prompt = "You are an expert agricultural consultant. Based on the following crop analysis results, provide brief treatment and care recommendations:\n\n"
+    
+    if crops:
+        prompt += "Identified Crops:\n"
+        for crop in crops:
+            prompt += f"- {crop['name']} ({crop['scientific_name']}): {crop['confidence']}% confidence\n"
+    
+    if diseases:
+        prompt += "\nDetected Plant Health Issues:\n"
+        for disease in diseases:
+            prompt += f"- {disease['name']}: {disease['confidence']}% confidence\n"
+    else:
+        prompt += "\nNo diseases detected - plant appears healthy.\n"
+    
+    prompt += "\nPlease provide:\n1. Brief assessment of the plant condition\n2. Immediate treatment recommendations (if needed)\n3. General care tips\n4. When to seek further consultation\n\nKeep the response concise but informative (maximum 200 words)."
+    return prompt
+
+def build_treatment_messages(crops, diseases):
+    """Build the chat messages sent to DeepSeek"""
+    return [
+        {"role": "system", "content": "You are an expert agricultural consultant specializing in crop disease diagnosis and treatment."},
+        {"role": "user", "content": build_treatment_prompt(crops, diseases)}
+    ]
+
+def confidence_band(confidence):
+    """Bucket a confidence percentage into a coarse band"""
+    if confidence > 80:
+        return "high"
+    elif confidence > 60:
+        return "medium"
+    return "low"
+
+def treatment_cache_key(crops, diseases):
+    """Build a cache key from the sorted crop and disease names and their confidence bands"""
+    crop_keys = sorted(f"{crop['name'].strip().lower()}:{confidence_band(crop['confidence'])}" for crop in crops or [])
+    disease_keys = sorted(f"{disease['name'].strip().lower()}:{confidence_band(disease['confidence'])}" for disease in diseases or [])
+    canonical = "|".join(crop_keys) + "#" + "|".join(disease_keys)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def deepseek_completion_args(crops, diseases):
+    """Keyword arguments for a DeepSeek treatment completion"""
+    return {
+        "model": OPENROUTER_MODEL,
+        "messages": build_treatment_messages(crops, diseases),
+        "max_tokens": 300,
+        "temperature": 0.7,
+        "extra_headers": {
+            "HTTP-Referer": "http://localhost:8000",
+            "X-Title": "Crop Disease Identification API"
+        }
+    }
+
+def deepseek_timeout(deadline):
+    """Time allowed for a DeepSeek call: DEEPSEEK_TIMEOUT capped by the request's
+    remaining latency budget, or None when too little of the budget is left"""
+    remaining = time_left(deadline)
+    if remaining is None:
+        return DEEPSEEK_TIMEOUT
+    if remaining < DEEPSEEK_MIN_BUDGET:
+        return None
+    return min(DEEPSEEK_TIMEOUT, remaining)
+
+async def deepseek_chat(crops, diseases, label):
+    """One non-streaming DeepSeek completion, returned as (label, text)"""
+    client = await deepseek_client()
+    completion = await client.chat.completions.create(**deepseek_completion_args(crops, diseases))
+    return label, completion.choices[0].message.content.strip()
+
+async def hedged_deepseek_chat(crops, diseases, timeout):
+    """Get a DeepSeek completion within timeout seconds
+    
+    If the request is still running after DEEPSEEK_HEDGE_DELAY, a backup
+    request is started when a concurrency slot is free; the first answer wins
+    and the other request is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    attempts = [asyncio.ensure_future(deepseek_chat(crops, diseases, "first"))]
+    hedged = False
+    try:
+        if 0 < DEEPSEEK_HEDGE_DELAY < timeout:
+            done, _ = await asyncio.wait(attempts, timeout=DEEPSEEK_HEDGE_DELAY)
+            # Backups only use spare capacity, so they never delay other requests
+            if not done and await try_acquire_deepseek_slot():
+                hedged = True
+                attempts.append(asyncio.ensure_future(deepseek_chat(crops, diseases, "backup")))
+        
+        error = None
+        for next_attempt in asyncio.as_completed(attempts, timeout=max(0, deadline - loop.time())):
+            try:
+                winner, text = await next_attempt
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                error = e
+                continue
+            if hedged:
+                HEDGED_REQUESTS.inc(winner=winner)
+            return text
+        if hedged:
+            HEDGED_REQUESTS.inc(winner="none")
+        raise error
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+        if hedged:
+            DEEPSEEK_SEMAPHORE.release()
+
+async def request_deepseek_treatment(crops, diseases, use_cache=True, deadline=None):
+    """Ask DeepSeek for treatment recommendations, returning None when it is unavailable
+    
+    With use_cache=False the cached treatment is ignored and replaced by a fresh one.
+    Concurrent requests for the same diagnosis share a single DeepSeek call.
+    deadline is the request's latency budget (see resilience.deadline_after).
+    """
+    flight_key = (treatment_cache_key(crops, diseases), use_cache)
+    try:
+        return await TREATMENT_FLIGHTS.run(
+            flight_key, fetch_deepseek_treatment, crops, diseases, use_cache, deadline,
+            timeout=time_left(deadline)
+        )
+    except asyncio.TimeoutError:
+        # Joined a shared call that outlived this request's budget
+        print("Latency budget exhausted, using basic recommendations")
+        TREATMENT_FALLBACKS.inc(reason="budget_exhausted")
+        return None
+
+async def fetch_deepseek_treatment(crops, diseases, use_cache=True, deadline=None):
+    """Look up or request one DeepSeek treatment; see request_deepseek_treatment"""
+    cache_key = treatment_cache_key(crops, diseases)
+    if use_cache:
+        cached_treatment = await TREATMENT_CACHE.get(cache_key)
+        if cached_treatment is not None:
+            return cached_treatment
+    
+    if await deepseek_client() is None:
         print("DeepSeek client not available, using basic recommendations")
-        return get_basic_treatment_recommendations(crops, diseases)
+        TREATMENT_FALLBACKS.inc(reason="not_configured")
+        return None
+    
+    timeout = await acquire_deepseek_slot(deadline)
+    if timeout is None:
+        return None
         
     try:
-        # Create a prompt for DeepSeek
-        prompt = "You are an expert agricultural consultant. Based on the following crop analysis results, provide brief treatment and care recommendations:\n\n"
+        # Call DeepSeek API with proper headers
+        with UPSTREAM_IN_FLIGHT.track(upstream="deepseek"), STAGE_SECONDS.time(stage="deepseek"):
+            ai_treatment = await hedged_deepseek_chat(crops, diseases, timeout)
         
-        if crops:
-            prompt += "Identified Crops:\n"
-            for crop in crops:
-                prompt += f"- {crop['name']} ({crop['scientific_name']}): {crop['confidence']}% confidence\n"
+        DEEPSEEK_BREAKER.record_success()
+        await TREATMENT_CACHE.set(cache_key, ai_treatment)
+        return ai_treatment
         
-        if diseases:
-            prompt += "\nDetected Plant Health Issues:\n"
-            for disease in diseases:
-                prompt += f"- {disease['name']}: {disease['confidence']}% confidence\n"
+    except asyncio.TimeoutError:
+        print(f"DeepSeek API timed out after {timeout:.1f}s, using basic recommendations")
+        DEEPSEEK_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="deepseek", kind="timeout")
+        TREATMENT_FALLBACKS.inc(reason="timeout")
+        return None
+    except Exception as e:
+        print(f"DeepSeek API Error: {str(e)}")
+        DEEPSEEK_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="deepseek", kind="error")
+        TREATMENT_FALLBACKS.inc(reason="error")
+        return None
+    finally:
+        DEEPSEEK_SEMAPHORE.release()
+
+async def acquire_deepseek_slot(deadline):
+    """Take a DeepSeek concurrency slot and return the time allowed for the call
+    
+    Returns None, with the slot released and the fallback reason counted,
+    when the call should be skipped in favour of basic recommendations.
+    """
+    # Wait briefly for a free slot, otherwise degrade to basic recommendations
+    queue_timeout = DEEPSEEK_QUEUE_TIMEOUT
+    remaining = time_left(deadline)
+    if remaining is not None:
+        queue_timeout = max(0, min(queue_timeout, remaining - DEEPSEEK_MIN_BUDGET))
+    try:
+        if queue_timeout <= 0:
+            # No time to queue: wait_for with a zero timeout would give up even on a free slot
+            if not await try_acquire_deepseek_slot():
+                raise asyncio.TimeoutError()
         else:
-            prompt += "\nNo diseases detected - plant appears healthy.\n"
-        
-        prompt += "\nPlease provide:\n1. Brief assessment of the plant condition\n2. Immediate treatment recommendations (if needed)\n3. General care tips\n4. When to seek further consultation\n\nKeep the response concise but informative (maximum 200 words)."
-        
-        # Call DeepSeek API with proper headers
-        completion = DEEPSEEK_CLIENT.chat.completions.create(
-            model=OPENROUTER_MODEL,
-            messages=[
-                {"role": "system", "content": "You are an expert agricultural consultant specializing in crop disease diagnosis and treatment."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300,
-            temperature=0.7,
-            extra_headers={
-                "HTTP-Referer": "http://localhost:8000",
-                "X-Title": "Crop Disease Identification API"
-            }
+            await asyncio.wait_for(DEEPSEEK_SEMAPHORE.acquire(), timeout=queue_timeout)
+    except asyncio.TimeoutError:
+        print("DeepSeek concurrency limit reached, using basic recommendations")
+        TREATMENT_FALLBACKS.inc(reason="concurrency_limit")
+        return None
+    
+    timeout = deepseek_timeout(deadline)
+    if timeout is None:
+        print("Latency budget exhausted, using basic recommendations")
+        TREATMENT_FALLBACKS.inc(reason="budget_exhausted")
+        DEEPSEEK_SEMAPHORE.release()
+        return None
+    if not DEEPSEEK_BREAKER.allow():
+        print("DeepSeek circuit breaker open, using basic recommendations")
+        TREATMENT_FALLBACKS.inc(reason="circuit_open")
+        DEEPSEEK_SEMAPHORE.release()
+        return None
+    return timeout
+
+async def stream_deepseek_treatment(crops, diseases, outcome, use_cache=True, deadline=None):
+    """Yield DeepSeek treatment text as it is generated
+    
+    The complete text is stored in outcome['text'] on success. When DeepSeek is
+    unavailable or fails part-way, outcome['text'] is left unset so the caller
+    can fall back to basic recommendations.
+    """
+    cache_key = treatment_cache_key(crops, diseases)
+    if use_cache:
+        cached_treatment = await TREATMENT_CACHE.get(cache_key)
+        if cached_treatment is not None:
+            outcome['text'] = cached_treatment
+            yield cached_treatment
+            return
+    
+    client = await deepseek_client()
+    if client is None:
+        print("DeepSeek client not available, using basic recommendations")
+        TREATMENT_FALLBACKS.inc(reason="not_configured")
+        return
+    
+    timeout = await acquire_deepseek_slot(deadline)
+    if timeout is None:
+        return
+    
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    call_deadline = started + timeout
+    stream = None
+    parts = []
+    UPSTREAM_IN_FLIGHT.inc(upstream="deepseek")
+    try:
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(stream=True, **deepseek_completion_args(crops, diseases)),
+            timeout=timeout
         )
+        chunks = stream.__aiter__()
+        while True:
+            remaining = call_deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                break
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                parts.append(token)
+                yield token
         
-        return completion.choices[0].message.content.strip()
-        
+        ai_treatment = "".join(parts).strip()
+        DEEPSEEK_BREAKER.record_success()
+        if ai_treatment:
+            await TREATMENT_CACHE.set(cache_key, ai_treatment)
+            outcome['text'] = ai_treatment
+        STAGE_SECONDS.observe(loop.time() - started, stage="deepseek")
+            
+    except asyncio.TimeoutError:
+        print(f"DeepSeek API timed out after {timeout:.1f}s, using basic recommendations")
+        DEEPSEEK_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="deepseek", kind="timeout")
+        TREATMENT_FALLBACKS.inc(reason="timeout")
     except Exception as e:
         print(f"DeepSeek API Error: {str(e)}")
+        DEEPSEEK_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="deepseek", kind="error")
+        TREATMENT_FALLBACKS.inc(reason="error")
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(upstream="deepseek")
+        if stream is not None:
+            await stream.response.aclose()
+        DEEPSEEK_SEMAPHORE.release()
+
+async def get_deepseek_treatment(crops, diseases, use_cache=True):
+    """Get treatment recommendations from DeepSeek AI"""
+    ai_treatment = await request_deepseek_treatment(crops, diseases, use_cache=use_cache)
+    if ai_treatment is None:
         # Fallback to basic treatment recommendations
         return get_basic_treatment_recommendations(crops, diseases)
+    return ai_treatment
 
 def get_basic_treatment_recommendations(crops, diseases):
     """Provide basic treatment recommendations when AI API is unavailable"""
-    recommendations = "Basic Treatment Recommendations:\n\n"
-    
-    if diseases and len(diseases) > 0:
-        recommendations += "Plant Health Issues Detected:\n"
-        for disease in diseases:
-            disease_name = disease['name'].lower()
-            
-            # Basic recommendations based on common disease types
-            if 'blight' in disease_name or 'spot' in disease_name:
-                recommendations += f"- {disease['name']}: Remove affected leaves, improve air circulation, consider copper-based fungicide.\n"
-            elif 'rust' in disease_name:
-                recommendations += f"- {disease['name']}: Remove infected parts, avoid overhead watering, apply fungicide if severe.\n"
-            elif 'mildew' in disease_name:
-                recommendations += f"- {disease['name']}: Increase air circulation, reduce humidity, consider organic fungicide treatment.\n"
-            elif 'rot' in disease_name:
-                recommendations += f"- {disease['name']}: Improve drainage, reduce watering, remove affected parts immediately.\n"
-            elif 'wilt' in disease_name:
-                recommendations += f"- {disease['name']}: Check soil drainage, adjust watering schedule, may need soil treatment.\n"
-            else:
-                recommendations += f"- {disease['name']}: Monitor closely, maintain good plant hygiene, consult agricultural expert.\n"
-        
-        recommendations += "\nGeneral Disease Management:\n"
-        recommendations += "- Remove and dispose of infected plant material\n"
-        recommendations += "- Improve air circulation around plants\n"
-        recommendations += "- Water at soil level, avoid wetting leaves\n"
-        recommendations += "- Apply preventive treatments if recommended\n"
-        recommendations += "- Monitor daily for disease progression\n"
-    else:
-        recommendations += "Plant Health Status: HEALTHY\n"
-        recommendations += "No diseases detected. Your crop appears to be in good condition!\n\n"
-        recommendations += "Preventive Care Tips:\n"
-        recommendations += "- Maintain regular watering schedule\n"
-        recommendations += "- Ensure proper soil drainage\n"
-        recommendations += "- Provide adequate nutrition\n"
-        recommendations += "- Monitor for early signs of stress\n"
-        recommendations += "- Keep growing area clean\n"
-    
-    if crops and len(crops) > 0:
-        crop_name = crops[0]['name'].lower()
-        recommendations += f"\nSpecific Care for {crops[0]['name']}:\n"
-        
-        # Basic care tips for common crops
-        if 'tomato' in crop_name:
-            recommendations += "- Provide support/stakes for growth\n- Regular pruning of suckers\n- Deep, infrequent watering\n"
-        elif 'corn' in crop_name or 'maize' in crop_name:
-            recommendations += "- Ensure adequate spacing\n- Side-dress with nitrogen fertilizer\n- Monitor for corn borer\n"
-        elif 'wheat' in crop_name:
-            recommendations += "- Monitor soil moisture\n- Watch for rust diseases\n- Time harvest properly\n"
-        elif 'rice' in crop_name:
-            recommendations += "- Maintain proper water levels\n- Monitor for blast disease\n- Ensure good drainage during maturity\n"
-        else:
-            recommendations += "- Follow standard crop management practices\n- Monitor growth stages\n- Adjust care based on plant needs\n"
-    
-    recommendations += "\nFor detailed consultation, click 'Send to ChatBot' below."
-    
-    return recommendations
+    with STAGE_SECONDS.time(stage="basic_fallback"):
+        return TREATMENT_RULES.render(crops, diseases)
+
+def render_basic_treatments(diagnoses, rules):
+    """Basic recommendations for several (crops, diseases) pairs of one batch, from the batch's rule snapshot"""
+    with STAGE_SECONDS.time(stage="basic_fallback"):
+        return TREATMENT_RULES.render_batch(diagnoses, rules)
 
 @app.get("/", response_class=HTMLResponse)
 async def get_upload_form():
@@ -255,21 +855,37 @@ async def get_upload_form():
 
                 document.getElementById('loading').style.display = 'block';
                 document.getElementById('results').style.display = 'none';
+                document.getElementById('chatbotBtn').disabled = true;
+                analysisResults = null;
 
                 try {
-                    const response = await fetch('/analyze', {
+                    const response = await fetch('/analyze/stream', {
                         method: 'POST',
                         body: formData
                     });
 
-                    const result = await response.json();
-                    
-                    if (result.success) {
-                        analysisResults = result;
-                        displayResults(result);
-                        document.getElementById('chatbotBtn').disabled = false;
-                    } else {
-                        alert('Analysis failed: ' + result.error);
+                    if (!response.ok) {
+                        const result = await response.json();
+                        alert('Analysis failed: ' + (result.detail || result.error));
+                        return;
+                    }
+
+                    // Read Server-Sent Events as they arrive
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+
+                        let boundary;
+                        while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                            const rawEvent = buffer.slice(0, boundary);
+                            buffer = buffer.slice(boundary + 2);
+                            handleStreamEvent(rawEvent);
+                        }
                     }
                 } catch (error) {
                     alert('Error: ' + error.message);
@@ -278,6 +894,39 @@ async def get_upload_form():
                 }
             }
 
+            function handleStreamEvent(rawEvent) {
+                let eventType = 'message';
+                let data = '';
+                rawEvent.split('\\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventType = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (!data) return;
+                const payload = JSON.parse(data);
+                const treatment = document.getElementById('treatmentContent');
+
+                if (eventType === 'diagnosis') {
+                    displayResults(payload);
+                    document.getElementById('loading').style.display = 'none';
+                    treatment.textContent = 'Generating AI treatment recommendations...';
+                    treatment.dataset.started = '';
+                } else if (eventType === 'treatment_token') {
+                    if (!treatment.dataset.started) {
+                        treatment.textContent = '';
+                        treatment.dataset.started = '1';
+                    }
+                    treatment.textContent += payload.text;
+                } else if (eventType === 'treatment_fallback') {
+                    treatment.textContent = payload.text;
+                } else if (eventType === 'done') {
+                    analysisResults = payload;
+                    treatment.textContent = payload.ai_treatment;
+                    document.getElementById('chatbotBtn').disabled = false;
+                } else if (eventType === 'error') {
+                    alert('Analysis failed: ' + JSON.stringify(payload.detail));
+                }
+            }
+
             function displayResults(result) {
                 let html = '<h4>Identified Crops:</h4>';
                 
@@ -347,133 +996,631 @@ async def get_upload_form():
     """
     return html_content
 
-@app.post("/analyze")
-async def analyze_crop_image(file: UploadFile = File(...)):
-    """Analyze uploaded crop image using KindWise API"""
+def base64_length(size):
+    """Length of the base64 encoding of size bytes"""
+    return (size + 2) // 3 * 4
+
+def kindwise_request_body(jpeg_bytes):
+    """Build the KindWise JSON body as (length, async byte stream)
     
-    # Check if API key is available
-    if not API_KEY:
-        raise HTTPException(status_code=500, detail="KindWise API key not configured. Please set KINDWISE_API_KEY in environment variables.")
+    The body is ``{"images": ["<base64 JPEG>"], "similar_images": true}``, but
+    the image is base64-encoded one chunk at a time while it is sent, so the
+    full base64 string and serialized JSON never exist in memory.
+    """
+    prefix = b'{"images": ["'
+    suffix = b'"], "similar_images": true}'
+    view = memoryview(jpeg_bytes)
+    
+    async def stream():
+        yield prefix
+        encode_seconds = 0.0
+        for offset in range(0, len(view), KINDWISE_BODY_CHUNK):
+            started = time.perf_counter()
+            chunk = base64.b64encode(view[offset:offset + KINDWISE_BODY_CHUNK])
+            encode_seconds += time.perf_counter() - started
+            yield chunk
+        STAGE_SECONDS.observe(encode_seconds, stage="base64")
+        yield suffix
+    
+    return len(prefix) + base64_length(len(view)) + len(suffix), stream()
+
+async def call_kindwise(jpeg_bytes, deadline=None):
+    """Send a JPEG to KindWise and return the parsed JSON response
     
+    Fails fast with 503 while the KindWise circuit breaker is open, and with
+    504 when the request's latency budget runs out.
+    """
+    remaining = time_left(deadline)
+    if remaining is not None and remaining <= 0:
+        raise HTTPException(status_code=504, detail="Analysis latency budget exhausted before calling KindWise")
+    if not KINDWISE_BREAKER.allow():
+        raise HTTPException(
+            status_code=503,
+            detail="KindWise API is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(KINDWISE_BREAKER.retry_after())}
+        )
+    
+    content_length, body = kindwise_request_body(jpeg_bytes)
+    headers = {
+        'Content-Type': 'application/json',
+        'Content-Length': str(content_length),
+        'Api-Key': API_KEY
+    }
+    
+    # Call KindWise API through the shared connection pool
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Read and process image
-        image_bytes = await file.read()
-        
-        # Validate image can be opened
+        client = await http_client()
+        with UPSTREAM_IN_FLIGHT.track(upstream="kindwise"), STAGE_SECONDS.time(stage="kindwise"):
+            response = await asyncio.wait_for(
+                client.post(API_URL, headers=headers, content=body),
+                timeout=remaining
+            )
+    except (httpx.TimeoutException, asyncio.TimeoutError):
+        KINDWISE_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="kindwise", kind="timeout")
+        raise HTTPException(status_code=504, detail="KindWise API request timed out")
+    except httpx.HTTPError as http_err:
+        KINDWISE_BREAKER.record_failure()
+        UPSTREAM_ERRORS.inc(upstream="kindwise", kind="transport")
+        raise HTTPException(status_code=502, detail=f"KindWise API request failed: {str(http_err)}")
+    
+    # Rejections of one image (4xx) say nothing about the health of the API
+    if response.status_code >= 500 or response.status_code == 429:
+        KINDWISE_BREAKER.record_failure()
+    else:
+        KINDWISE_BREAKER.record_success()
+    
+    if response.status_code not in [200, 201]:
+        UPSTREAM_ERRORS.inc(upstream="kindwise", kind=f"http_{response.status_code}")
+        error_detail = f"API returned status code {response.status_code}"
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            # Resize if too large
-            if max(image.size) > MAX_IMAGE_SIZE:
-                ratio = MAX_IMAGE_SIZE / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                image = image.resize(new_size, Image.LANCZOS)
-            
-            # Convert to RGB and save as JPEG
-            image = image.convert('RGB')
-            output_buffer = io.BytesIO()
-            image.save(output_buffer, format='JPEG', quality=JPEG_QUALITY)
-            image_bytes = output_buffer.getvalue()
-            
-        except Exception as img_err:
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(img_err)}")
+            error_detail = response.json()
+        except:
+            try:
+                error_detail = response.text
+            except:
+                pass
         
-        # Encode image for API
-        encoded_string = base64.b64encode(image_bytes).decode('utf-8')
+        raise HTTPException(status_code=500, detail=f"API Error: {error_detail}")
+    
+    return response.json()
+
+def parse_kindwise_result(data):
+    """Extract crop and disease suggestions from a KindWise response"""
+    crops = []
+    diseases = []
+    
+    if 'result' in data and data['result']:
+        result_data = data['result']
         
-        # Prepare API request
-        headers = {
-            'Content-Type': 'application/json',
-            'Api-Key': API_KEY
-        }
+        # Extract crop information
+        if 'crop' in result_data and 'suggestions' in result_data['crop']:
+            for crop in result_data['crop']['suggestions']:
+                crops.append({
+                    'name': crop.get('name', 'Unknown'),
+                    'scientific_name': crop.get('scientific_name', ''),
+                    'confidence': round(crop.get('probability', 0) * 100, 2)
+                })
         
-        payload = {
-            'images': [encoded_string],
-            'similar_images': True
-        }
+        # Extract disease information
+        if 'disease' in result_data and 'suggestions' in result_data['disease']:
+            for disease in result_data['disease']['suggestions']:
+                diseases.append({
+                    'name': disease.get('name', 'Unknown'),
+                    'confidence': round(disease.get('probability', 0) * 100, 2)
+                })
+    
+    return crops, diseases
+
+def upload_too_large():
+    return HTTPException(status_code=413, detail=f"Image is too large (maximum {MAX_UPLOAD_MB} MB)")
+
+async def read_upload(file):
+    """Validate an uploaded file's type and read its bytes, timing the read
+    
+    The file is read in chunks into a single preallocated buffer, and reading
+    stops with 413 as soon as it exceeds MAX_UPLOAD_MB.
+    """
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    if file.size is not None and file.size > max_bytes:
+        raise upload_too_large()
+    
+    started = time.perf_counter()
+    buffer = bytearray(file.size or UPLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    filled = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if filled + len(chunk) > max_bytes:
+            raise upload_too_large()
+        if filled + len(chunk) > len(buffer):
+            # Size unknown up front: grow geometrically
+            view.release()
+            buffer.extend(bytes(max(len(buffer), len(chunk))))
+            view = memoryview(buffer)
+        view[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+    view.release()
+    del buffer[filled:]
+    upload_read_ms = round((time.perf_counter() - started) * 1000, 2)
+    return buffer, upload_read_ms
+
+async def normalize_image(image_bytes, upload_read_ms=0.0):
+    """Normalize raw image bytes in the worker pool, adding the image hash and stage timings"""
+    # Decode, resize and re-encode in the image worker pool
+    try:
+        processed = await IMAGE_POOL.run(
+            preprocess_image, image_bytes, MAX_IMAGE_SIZE, JPEG_QUALITY,
+            IMAGE_TARGET_BYTES if IMAGE_ENCODING_MODE == "adaptive" else 0,
+            IMAGE_MIN_QUALITY, IMAGE_MIN_SIZE, PRESCREEN_SETTINGS
+        )
+    except ImageQueueFull as queue_err:
+        raise HTTPException(status_code=503, detail=str(queue_err))
+    except ValueError as img_err:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(img_err)}")
+    
+    # Identical normalized images share a cached diagnosis
+    processed['image_hash'] = hashlib.sha256(processed['jpeg_bytes']).hexdigest()
+    processed['timings'] = {'upload_read_ms': upload_read_ms, **processed['timings']}
+    for stage_timing, ms in processed['timings'].items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage_timing[:-len('_ms')])
+    
+    screen = processed.pop('prescreen', None)
+    if screen is not None:
+        PRESCREEN_COUNTS['checked'] += 1
+    if screen is not None and screen['reasons']:
+        action = "rejected" if PRESCREEN_MODE == "reject" else "warned"
+        PRESCREEN_COUNTS[action] += 1
+        for reason in screen['reasons']:
+            PRESCREEN_COUNTS['reasons'][reason] = PRESCREEN_COUNTS['reasons'].get(reason, 0) + 1
+            PRESCREEN_FLAGS.inc(reason=reason, action=action)
+        if action == "rejected":
+            # Unusable photos are turned away before they cost a KindWise call
+            raise HTTPException(status_code=422, detail={
+                'message': "Photo rejected by quality check: " + " ".join(PRESCREEN_ADVICE[reason] for reason in screen['reasons']),
+                'reasons': screen['reasons'],
+                'scores': screen['scores']
+            })
+        processed['image_warnings'] = [PRESCREEN_ADVICE[reason] for reason in screen['reasons']]
+    return processed
+
+async def preprocess_upload(file):
+    """Validate, read and normalize an uploaded image"""
+    image_bytes, upload_read_ms = await read_upload(file)
+    return await normalize_image(image_bytes, upload_read_ms)
+
+async def identify_crop_image(processed, deadline=None):
+    """Diagnose a processed image, from the diagnosis cache or KindWise
+    
+    Concurrent requests for the same image share a single KindWise call.
+    """
+    image_hash = processed['image_hash']
+    cached = await DIAGNOSIS_CACHE.get(image_hash)
+    
+    if cached is not None:
+        print(f"Diagnosis cache hit for {image_hash[:12]}")
+        return {**cached, 'cached': True}
+    
+    try:
+        data = await KINDWISE_FLIGHTS.run(
+            image_hash, call_kindwise, processed['jpeg_bytes'], deadline,
+            timeout=time_left(deadline)
+        )
+    except asyncio.TimeoutError:
+        # Joined a shared call that outlived this request's budget
+        raise HTTPException(status_code=504, detail="Analysis latency budget exhausted waiting for KindWise")
+    crops, diseases = parse_kindwise_result(data)
+    return {
+        'crops': crops,
+        'diseases': diseases,
+        'raw_data': data,
+        'ai_treatment': None,
+        'cached': False
+    }
+
+async def remember_diagnosis(image_hash, diagnosis, ai_treatment):
+    """Cache a diagnosis; only AI treatments are kept so a degraded answer is retried next time"""
+    if not diagnosis['cached'] or ai_treatment is not None:
+        await DIAGNOSIS_CACHE.set(image_hash, {
+            'crops': diagnosis['crops'],
+            'diseases': diagnosis['diseases'],
+            'raw_data': diagnosis['raw_data'],
+            'ai_treatment': ai_treatment
+        })
+
+def build_result_summary(filename, processed, diagnosis):
+    """Assemble the /analyze response from a diagnosis"""
+    summary = {
+        'success': True,
+        'analysis_id': ArtifactStore.new_id(),
+        'crops': diagnosis['crops'],
+        'diseases': diagnosis['diseases'],
+        'raw_data': diagnosis['raw_data'],
+        'image_filename': filename,
+        'image_hash': processed['image_hash'],
+        'cached': diagnosis['cached'],
+        'encoding': {
+            'width': processed['width'],
+            'height': processed['height'],
+            'jpeg_quality': processed['jpeg_quality'],
+            'payload_bytes': base64_length(len(processed['jpeg_bytes']))
+        },
+        'timings': processed['timings']
+    }
+    if processed.get('image_warnings'):
+        summary['image_warnings'] = processed['image_warnings']
+    return summary
+
+# Kept in every shaped result so clients can always tell success from failure
+ALWAYS_RETURNED_FIELDS = {'success', 'index', 'error', 'status_code'}
+
+def shape_result(result, include_raw=False, fields=None):
+    """Trim an analysis result for the client
+    
+    The full KindWise payload (raw_data) is only returned with include_raw;
+    fields is an optional comma-separated list of top-level keys to keep.
+    """
+    if fields:
+        wanted = {name.strip() for name in fields.split(',') if name.strip()} | ALWAYS_RETURNED_FIELDS
+        if include_raw:
+            wanted.add('raw_data')
+        return {key: value for key, value in result.items() if key in wanted}
+    if include_raw:
+        return result
+    return {key: value for key, value in result.items() if key != 'raw_data'}
+
+async def run_analysis(filename, processed, treatment_cache=True, deadline=None):
+    """Diagnose a processed image and attach treatment recommendations
+    
+    Basic recommendations replace DeepSeek when its breaker is open or the
+    latency budget (deadline) is nearly used up.
+    """
+    diagnosis = await identify_crop_image(processed, deadline)
+    crops = diagnosis['crops']
+    diseases = diagnosis['diseases']
+    
+    # Save results for chatbot integration
+    result_summary = build_result_summary(filename, processed, diagnosis)
+    
+    ai_treatment = diagnosis['ai_treatment'] if treatment_cache else None
+    if ai_treatment is None:
+        # Automatically get AI treatment recommendations from DeepSeek
+        print("Getting AI treatment recommendations...")
+        try:
+            ai_treatment = await request_deepseek_treatment(crops, diseases, use_cache=treatment_cache, deadline=deadline)
+            if ai_treatment is not None:
+                print("AI treatment recommendations obtained successfully")
+        except Exception as ai_error:
+            print(f"AI treatment error: {str(ai_error)}")
         
-        # Call KindWise API
-        response = requests.post(API_URL, headers=headers, json=payload)
+        await remember_diagnosis(processed['image_hash'], diagnosis, ai_treatment)
+    
+    if ai_treatment is None:
+        # Use basic recommendations as fallback
+        ai_treatment = get_basic_treatment_recommendations(crops, diseases)
+    result_summary['ai_treatment'] = ai_treatment
+    
+    return result_summary
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+@app.post("/analyze")
+async def analyze_crop_image(background_tasks: BackgroundTasks, file: UploadFile = File(...), treatment_cache: bool = True,
+                             include_raw: bool = False, fields: Optional[str] = None):
+    """Analyze uploaded crop image using KindWise API
+    
+    Pass treatment_cache=false to bypass cached treatment recommendations.
+    The KindWise payload is only included with include_raw=true, and
+    fields=crops,diseases,... limits the response to those keys.
+    The full result and image are stored under the returned analysis_id after
+    the response has been sent.
+    """
+    deadline = deadline_after(ANALYZE_BUDGET)
+    
+    # Check if API key is available
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="KindWise API key not configured. Please set KINDWISE_API_KEY in environment variables.")
+    
+    try:
+        processed = await preprocess_upload(file)
+        result_summary = await run_analysis(file.filename, processed, treatment_cache, deadline)
         
-        if response.status_code in [200, 201]:
-            data = response.json()
+        # Store the artifact once the response is on its way
+        await ARTIFACTS.stage(result_summary['analysis_id'], result_summary, processed['jpeg_bytes'])
+        background_tasks.add_task(ARTIFACTS.flush, result_summary['analysis_id'])
+        return shape_result(result_summary, include_raw, fields)
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/stream")
+async def analyze_crop_image_stream(file: UploadFile = File(...), treatment_cache: bool = True,
+                                    include_raw: bool = False, fields: Optional[str] = None):
+    """Analyze uploaded crop image and stream results as Server-Sent Events
+    
+    Emits a ``diagnosis`` event as soon as KindWise answers, ``treatment_token``
+    events while DeepSeek generates, ``treatment_fallback`` if basic
+    recommendations replace the AI text, then ``done`` with the result, shaped
+    by include_raw and fields as for /analyze. Failures after the stream has
+    started are sent as an ``error`` event.
+    """
+    deadline = deadline_after(ANALYZE_BUDGET)
+    
+    # Check if API key is available
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="KindWise API key not configured. Please set KINDWISE_API_KEY in environment variables.")
+    
+    # Upload problems are reported as normal HTTP errors before streaming starts
+    processed = await preprocess_upload(file)
+    filename = file.filename
+    
+    async def event_stream():
+        try:
+            diagnosis = await identify_crop_image(processed, deadline)
+            crops = diagnosis['crops']
+            diseases = diagnosis['diseases']
             
-            # Parse results
-            crops = []
-            diseases = []
+            result_summary = build_result_summary(filename, processed, diagnosis)
+            yield sse_event("diagnosis", shape_result(result_summary, fields=fields))
             
-            if 'result' in data and data['result']:
-                result_data = data['result']
+            ai_treatment = diagnosis['ai_treatment'] if treatment_cache else None
+            if ai_treatment is not None:
+                yield sse_event("treatment_token", {"text": ai_treatment})
+            else:
+                outcome = {}
+                async for token in stream_deepseek_treatment(crops, diseases, outcome, use_cache=treatment_cache, deadline=deadline):
+                    yield sse_event("treatment_token", {"text": token})
+                ai_treatment = outcome.get('text')
                 
-                # Extract crop information
-                if 'crop' in result_data and 'suggestions' in result_data['crop']:
-                    for crop in result_data['crop']['suggestions']:
-                        crops.append({
-                            'name': crop.get('name', 'Unknown'),
-                            'scientific_name': crop.get('scientific_name', ''),
-                            'confidence': round(crop.get('probability', 0) * 100, 2)
-                        })
+                await remember_diagnosis(processed['image_hash'], diagnosis, ai_treatment)
                 
-                # Extract disease information
-                if 'disease' in result_data and 'suggestions' in result_data['disease']:
-                    for disease in result_data['disease']['suggestions']:
-                        diseases.append({
-                            'name': disease.get('name', 'Unknown'),
-                            'confidence': round(disease.get('probability', 0) * 100, 2)
-                        })
-            
-            # Save results for chatbot integration
-            result_summary = {
-                'success': True,
-                'crops': crops,
-                'diseases': diseases,
-                'raw_data': data,
-                'image_filename': file.filename
-            }
+                if ai_treatment is None:
+                    # Use basic recommendations as fallback
+                    ai_treatment = get_basic_treatment_recommendations(crops, diseases)
+                    yield sse_event("treatment_fallback", {"text": ai_treatment})
             
-            # Automatically get AI treatment recommendations from DeepSeek
-            print("Getting AI treatment recommendations...")
-            try:
-                ai_treatment = await get_deepseek_treatment(crops, diseases)
-                result_summary['ai_treatment'] = ai_treatment
-                print("AI treatment recommendations obtained successfully")
-            except Exception as ai_error:
-                print(f"AI treatment error: {str(ai_error)}")
-                # Use basic recommendations as fallback
-                ai_treatment = get_basic_treatment_recommendations(crops, diseases)
-                result_summary['ai_treatment'] = ai_treatment
+            result_summary['ai_treatment'] = ai_treatment
+            await ARTIFACTS.defer(result_summary['analysis_id'], result_summary, processed['jpeg_bytes'])
+            yield sse_event("done", shape_result(result_summary, include_raw, fields))
             
-            # Save to temporary files for chatbot integration
-            crop_data_file = os.path.join(UPLOAD_DIR, "latest_analysis.json")
-            with open(crop_data_file, "w") as f:
-                json.dump(result_summary, f)
-            
-            # Save the analyzed image
-            image_file_path = os.path.join(UPLOAD_DIR, "latest_image.jpg")
-            with open(image_file_path, "wb") as f:
-                f.write(image_bytes)
-            
-            return result_summary
+        except HTTPException as http_err:
+            yield sse_event("error", {"status_code": http_err.status_code, "detail": http_err.detail})
+        except Exception as e:
+            yield sse_event("error", {"status_code": 500, "detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def analyze_batch_item(index, file, semaphore, treatment_tasks, treatment_cache, batch_deadline,
+                             rules, pending_fallbacks=None):
+    """Analyze one image of a batch, reporting failures in the result instead of raising
+    
+    Treatment lookups shared between images run under batch_deadline, so the
+    image that happens to start one does not cut it short for the others.
+    Basic recommendations come from the batch's rule snapshot ``rules``. With
+    a ``pending_fallbacks`` list they are left for finish_batch_fallbacks()
+    to render for the whole batch; otherwise (streamed results) right away.
+    """
+    async with semaphore:
+        # Each image's latency budget starts when it gets its turn
+        deadline = deadline_after(ANALYZE_BUDGET)
+        try:
+            processed = await preprocess_upload(file)
+            diagnosis = await identify_crop_image(processed, deadline)
+            crops = diagnosis['crops']
+            diseases = diagnosis['diseases']
+            result_summary = build_result_summary(file.filename, processed, diagnosis)
             
-        else:
-            error_detail = f"API returned status code {response.status_code}"
-            try:
-                error_detail = response.json()
-            except:
+            ai_treatment = diagnosis['ai_treatment'] if treatment_cache else None
+            if ai_treatment is None:
+                # Images with the same diagnosis share one treatment lookup
+                treatment_key = treatment_cache_key(crops, diseases)
+                treatment_task = treatment_tasks.get(treatment_key)
+                if treatment_task is None:
+                    treatment_task = asyncio.ensure_future(
+                        request_deepseek_treatment(crops, diseases, use_cache=treatment_cache, deadline=batch_deadline)
+                    )
+                    treatment_tasks[treatment_key] = treatment_task
                 try:
-                    error_detail = response.text
-                except:
-                    pass
+                    ai_treatment = await asyncio.wait_for(asyncio.shield(treatment_task), timeout=time_left(deadline))
+                except asyncio.TimeoutError:
+                    TREATMENT_FALLBACKS.inc(reason="budget_exhausted")
+                    ai_treatment = None
+                
+                await remember_diagnosis(processed['image_hash'], diagnosis, ai_treatment)
+            
+            if ai_treatment is None and pending_fallbacks is not None:
+                result = {'index': index, **result_summary}
+                pending_fallbacks.append((result, result_summary, (crops, diseases), processed['jpeg_bytes']))
+                return result
+            if ai_treatment is None:
+                # Use basic recommendations as fallback
+                ai_treatment = render_basic_treatments([(crops, diseases)], rules)[0]
+            result_summary['ai_treatment'] = ai_treatment
+            await ARTIFACTS.defer(result_summary['analysis_id'], result_summary, processed['jpeg_bytes'])
             
-            raise HTTPException(status_code=500, detail=f"API Error: {error_detail}")
+            return {'index': index, **result_summary}
             
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        except HTTPException as http_err:
+            return {'index': index, 'success': False, 'image_filename': file.filename, 'status_code': http_err.status_code, 'error': http_err.detail}
+        except Exception as e:
+            return {'index': index, 'success': False, 'image_filename': file.filename, 'status_code': 500, 'error': str(e)}
+
+def start_batch(files, treatment_cache, pending_fallbacks=None):
+    """Validate a batch upload and schedule one analysis task per image
+    
+    Returns the tasks, the dict of shared treatment tasks they fill in and
+    the rule snapshot used for the batch's basic recommendations; pass the
+    first two to cancel_batch() when the client goes away.
+    """
+    # Check if API key is available
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="KindWise API key not configured. Please set KINDWISE_API_KEY in environment variables.")
+    
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files: {len(files)} (maximum {BATCH_MAX_FILES} per batch)")
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    treatment_tasks = {}
+    # The last images start about one budget per BATCH_CONCURRENCY images later
+    waves = -(-len(files) // BATCH_CONCURRENCY)
+    batch_deadline = deadline_after(ANALYZE_BUDGET * waves)
+    # One rule table for the whole batch, even if the rule file reloads meanwhile
+    rules = TREATMENT_RULES.current()
+    tasks = [
+        asyncio.ensure_future(analyze_batch_item(
+            index, file, semaphore, treatment_tasks, treatment_cache, batch_deadline, rules, pending_fallbacks
+        ))
+        for index, file in enumerate(files)
+    ]
+    return tasks, treatment_tasks, rules
+
+async def finish_batch_fallbacks(pending_fallbacks, rules):
+    """Render the basic recommendations a batch still needs in one pass, then store those analyses"""
+    if not pending_fallbacks:
+        return
+    treatments = render_basic_treatments([diagnosis for _, _, diagnosis, _ in pending_fallbacks], rules)
+    for (result, result_summary, _, jpeg_bytes), ai_treatment in zip(pending_fallbacks, treatments):
+        result['ai_treatment'] = result_summary['ai_treatment'] = ai_treatment
+        await ARTIFACTS.defer(result_summary['analysis_id'], result_summary, jpeg_bytes)
+
+def cancel_batch(tasks, treatment_tasks):
+    """Stop outstanding image analyses and the treatment lookups they share"""
+    for task in tasks:
+        task.cancel()
+    for treatment_task in treatment_tasks.values():
+        treatment_task.cancel()
+
+def summarize_batch(results):
+    """Count successes and failures in a batch"""
+    succeeded = sum(1 for result in results if result['success'])
+    return {'total': len(results), 'succeeded': succeeded, 'failed': len(results) - succeeded}
+
+@app.post("/analyze/batch")
+async def analyze_crop_image_batch(files: List[UploadFile] = File(...), treatment_cache: bool = True,
+                                   include_raw: bool = False, fields: Optional[str] = None):
+    """Analyze many crop images in one request
+    
+    Images are processed concurrently (BATCH_CONCURRENCY at a time) and each
+    entry in ``results`` carries either the analysis or that image's error.
+    include_raw and fields shape each entry as for /analyze.
+    """
+    pending_fallbacks = []
+    tasks, treatment_tasks, rules = start_batch(files, treatment_cache, pending_fallbacks)
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # Only has work to do if the client disconnected
+        cancel_batch(tasks, treatment_tasks)
+    await finish_batch_fallbacks(pending_fallbacks, rules)
+    return {
+        'success': True,
+        **summarize_batch(results),
+        'results': [shape_result(result, include_raw, fields) for result in results]
+    }
+
+@app.post("/analyze/batch/stream")
+async def analyze_crop_image_batch_stream(files: List[UploadFile] = File(...), treatment_cache: bool = True,
+                                          include_raw: bool = False, fields: Optional[str] = None):
+    """Analyze many crop images, streaming each result as a Server-Sent Event
+    
+    Emits one ``result`` event per image in completion order (use ``index``
+    to match it to the upload) and a final ``done`` event with the counts.
+    """
+    # Each result is sent as soon as it is ready, so fallbacks are rendered per image
+    tasks, treatment_tasks, _ = start_batch(files, treatment_cache)
+    
+    async def event_stream():
+        results = []
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                results.append(result)
+                yield sse_event("result", shape_result(result, include_raw, fields))
+            yield sse_event("done", {'success': True, **summarize_batch(results)})
+        finally:
+            # Stop outstanding work if the client disconnects
+            cancel_batch(tasks, treatment_tasks)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_analysis_job(payload):
+    """Job queue handler: run the /analyze pipeline on a queued upload
+    
+    The latency budget starts when the job starts running, not when it was queued.
+    """
+    deadline = deadline_after(ANALYZE_BUDGET)
+    image_bytes = await asyncio.to_thread(JOB_SPOOL.read, payload['upload_path'])
+    processed = await normalize_image(image_bytes, payload['upload_read_ms'])
+    result_summary = await run_analysis(payload['filename'], processed, payload['treatment_cache'], deadline)
+    await ARTIFACTS.defer(result_summary['analysis_id'], result_summary, processed['jpeg_bytes'])
+    return result_summary
+
+# Background workers for POST /jobs; uploads wait on disk, not in memory
+JOB_SPOOL = UploadSpool(os.path.join(UPLOAD_DIR, "job_uploads"))
+JOB_QUEUE = JobQueue(
+    run_analysis_job, workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, result_ttl=JOB_RESULT_TTL,
+    records=SharedCache(SHARED_STATE, "job", ttl=JOB_RESULT_TTL) if SHARED_STATE is not None else None,
+    spool=JOB_SPOOL
+)
+
+@app.post("/jobs", status_code=202)
+async def submit_analysis_job(file: UploadFile = File(...), priority: int = 0, treatment_cache: bool = True):
+    """Queue a crop image for background analysis and return its job id immediately
+    
+    Higher priority jobs run first. Poll GET /jobs/{job_id} for the result.
+    """
+    
+    # Check if API key is available
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="KindWise API key not configured. Please set KINDWISE_API_KEY in environment variables.")
+    
+    image_bytes, upload_read_ms = await read_upload(file)
+    upload_path = await asyncio.to_thread(JOB_SPOOL.write, image_bytes)
+    try:
+        job = JOB_QUEUE.submit({
+            'upload_path': upload_path,
+            'upload_read_ms': upload_read_ms,
+            'filename': file.filename,
+            'treatment_cache': treatment_cache
+        }, priority=priority)
+    except JobQueueFull as queue_err:
+        await asyncio.to_thread(JOB_SPOOL.discard, upload_path)
+        raise HTTPException(status_code=503, detail=str(queue_err), headers={"Retry-After": "5"})
+    await JOB_QUEUE.publish(job['job_id'])
+    
+    job['status_url'] = f"/jobs/{job['job_id']}"
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str, include_raw: bool = False, fields: Optional[str] = None):
+    """Get the status and, once finished, the result of an analysis job
+    
+    include_raw and fields shape the result as for /analyze.
+    """
+    job = await JOB_QUEUE.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job['result'] is not None:
+        job['result'] = shape_result(job['result'], include_raw, fields)
+    return job
 
 @app.post("/send-to-chatbot")
 async def send_to_chatbot(analysis_data: dict):
@@ -498,18 +1645,30 @@ async def send_to_chatbot(analysis_data: dict):
         if analysis_data.get('ai_treatment'):
             crop_summary += f"\nAI Treatment Recommendations:\n{analysis_data['ai_treatment']}\n"
         
-        # Save data for chatbot
+        # Hand over the image stored for this specific analysis
+        analysis_id = analysis_data.get('analysis_id')
+        if not ArtifactStore.is_valid_id(analysis_id):
+            return {"success": False, "error": "Analysis id missing or invalid. Please analyze the image again."}
+        await ARTIFACTS.flush(analysis_id)
+        image_file_path = ARTIFACTS.image_path(analysis_id)
+        if image_file_path is None:
+            return {"success": False, "error": "Analysis not found or expired. Please analyze the image again."}
+        
+        # Save data for chatbot; compact results leave the KindWise payload in the stored analysis
+        raw_data = analysis_data.get('raw_data')
+        if raw_data is None:
+            stored = await asyncio.to_thread(ARTIFACTS.load, analysis_id)
+            raw_data = (stored or {}).get('raw_data', {})
         chatbot_data = {
             "crop_summary": crop_summary,
-            "raw_data": analysis_data.get('raw_data', {})
+            "raw_data": raw_data
         }
         
-        crop_data_file = os.path.join(UPLOAD_DIR, "crop_analysis_data.json")
-        with open(crop_data_file, "w") as f:
-            json.dump(chatbot_data, f)
+        crop_data_file = await asyncio.to_thread(
+            ARTIFACTS.write_file, analysis_id, "crop_analysis_data.json", dumps(chatbot_data)
+        )
         
         # Get paths
-        image_file_path = os.path.join(UPLOAD_DIR, "latest_image.jpg")
         launcher_path = os.path.join("..", "chat_bot", "launch_chatbot.py")
         
         # Launch chatbot
@@ -528,10 +1687,76 @@ async def send_to_chatbot(analysis_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analyses/{analysis_id}")
+async def get_analysis(analysis_id: str, include_raw: bool = False, fields: Optional[str] = None):
+    """Get a stored analysis result by id
+    
+    include_raw and fields shape the result as for /analyze.
+    """
+    result = await asyncio.to_thread(ARTIFACTS.load, analysis_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Analysis not found or expired")
+    return shape_result(result, include_raw, fields)
+
+@app.get("/analyses/{analysis_id}/image")
+async def get_analysis_image(analysis_id: str):
+    """Get the normalized image stored for an analysis"""
+    await ARTIFACTS.flush(analysis_id)
+    image_file_path = ARTIFACTS.image_path(analysis_id)
+    if image_file_path is None:
+        raise HTTPException(status_code=404, detail="Analysis image not found or expired")
+    return FileResponse(image_file_path, media_type="image/jpeg")
+
+def collect_runtime_metrics():
+    """Refresh cache and queue metrics from their own statistics before a scrape"""
+    for cache in (DIAGNOSIS_CACHE, TREATMENT_CACHE):
+        stats = cache.stats()
+        CACHE_LOOKUPS.set_total(stats['hits'], cache=cache.name, result="hit")
+        CACHE_LOOKUPS.set_total(stats['misses'], cache=cache.name, result="miss")
+        CACHE_ENTRIES.set(stats['memory_entries'], cache=cache.name)
+    QUEUE_DEPTH.set(IMAGE_POOL.pending, queue="image_pool")
+    QUEUE_DEPTH.set(JOB_QUEUE.stats()['queue_depth'], queue="jobs")
+
+    for breaker in (KINDWISE_BREAKER, DEEPSEEK_BREAKER):
+        CIRCUIT_STATE.set({"closed": 0, "half_open": 1, "open": 2}[breaker.state], upstream=breaker.name)
+    
+    startup = STARTUP.report()
+    STARTUP_SECONDS.set(sum(startup['imports_ms'].values()) / 1000, phase="imports")
+    if startup['ready_after_ms'] is not None:
+        STARTUP_SECONDS.set(startup['ready_after_ms'] / 1000, phase="ready")
+    if startup['first_request'] is not None:
+        STARTUP_SECONDS.set(startup['first_request']['served_after_ms'] / 1000, phase="first_request")
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, request counters and gauges"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "Crop Disease Identification API"}
+    """Health check endpoint
+    
+    Reports "degraded" while an upstream circuit breaker is not closed.
+    """
+    breakers = {breaker.name: breaker.stats() for breaker in (KINDWISE_BREAKER, DEEPSEEK_BREAKER)}
+    status = "healthy" if all(stats['state'] == "closed" for stats in breakers.values()) else "degraded"
+    return {"status": status, "service": "Crop Disease Identification API", "circuit_breakers": breakers}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until this worker and, with several workers, all of them have warmed up"""
+    if not WORKER_READY.is_set():
+        raise HTTPException(status_code=503, detail="Worker is warming up", headers={"Retry-After": "1"})
+    readiness = {"status": "ready", "worker": os.getpid(), "workers": WORKERS}
+    if SHARED_STATE is not None:
+        live_workers = await asyncio.to_thread(SHARED_STATE.live_workers, WORKER_HEARTBEAT_INTERVAL * 3)
+        readiness["workers_ready"] = sum(1 for worker in live_workers if worker['ready_at'] is not None)
+        if readiness["workers_ready"] < WORKERS:
+            readiness["status"] = "warming_up"
+            raise HTTPException(status_code=503, detail=readiness, headers={"Retry-After": "1"})
+    return readiness
 
 @app.get("/api/info")
 async def api_info():
@@ -546,23 +1771,72 @@ async def api_info():
             "openrouter_api_configured": bool(OPENROUTER_API_KEY),
             "upload_dir": UPLOAD_DIR,
             "max_image_size": MAX_IMAGE_SIZE,
-            "jpeg_quality": JPEG_QUALITY
+            "jpeg_quality": JPEG_QUALITY,
+            "json_encoder": JSON_ENCODER,
+            "image_encoding_mode": IMAGE_ENCODING_MODE,
+            "image_target_bytes": IMAGE_TARGET_BYTES if IMAGE_ENCODING_MODE == "adaptive" else None
+        },
+        "caches": {
+            "diagnosis": DIAGNOSIS_CACHE.stats(),
+            "treatment": TREATMENT_CACHE.stats()
+        },
+        "image_pool": IMAGE_POOL.stats(),
+        "job_queue": JOB_QUEUE.stats(),
+        "artifacts": ARTIFACTS.stats(),
+        "treatment_rules": TREATMENT_RULES.stats(),
+        "startup": STARTUP.report(),
+        "serving": {
+            "mode": SERVER_MODE,
+            "workers": WORKERS,
+            "worker_pid": os.getpid(),
+            "shared_state_db": SHARED_STATE_DB or None,
+            "deepseek_concurrency": DEEPSEEK_MAX_CONCURRENCY,
+            "deepseek_concurrency_shared": SHARED_STATE is not None
+        },
+        "prescreen": {
+            "mode": PRESCREEN_MODE,
+            "available": PRESCREEN_AVAILABLE,
+            "thresholds": PRESCREEN_SETTINGS,
+            **PRESCREEN_COUNTS
+        },
+        "latency_budget": {
+            "analyze_budget": ANALYZE_BUDGET or None,
+            "deepseek_min_budget": DEEPSEEK_MIN_BUDGET,
+            "deepseek_hedge_delay": DEEPSEEK_HEDGE_DELAY or None
+        },
+        "coalescing": {
+            "kindwise": KINDWISE_FLIGHTS.stats(),
+            "deepseek": TREATMENT_FLIGHTS.stats()
         },
         "endpoints": {
             "/": "Upload form (HTML interface)",
             "/analyze": "POST - Analyze crop image",
+            "/analyze/stream": "POST - Analyze crop image, streaming results as Server-Sent Events",
+            "/analyze/batch": "POST - Analyze many crop images in one request",
+            "/analyze/batch/stream": "POST - Analyze many crop images, streaming per-image results",
+            "/jobs": "POST - Queue a crop image for background analysis",
+            "/jobs/{job_id}": "GET - Job status and result",
             "/send-to-chatbot": "POST - Launch chatbot with results",
+            "/analyses/{analysis_id}": "GET - Stored analysis result",
+            "/analyses/{analysis_id}/image": "GET - Stored analysis image",
             "/health": "GET - Health check",
+            "/ready": "GET - Readiness check (503 while workers warm up)",
+            "/metrics": "GET - Prometheus metrics",
             "/api/info": "GET - API information"
         }
     }
 
 if __name__ == "__main__":
+    import uvicorn
+    
     # Get configuration from environment variables
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", "8000"))
-    RELOAD = os.getenv("RELOAD", "True").lower() == "true"
+    RELOAD = os.getenv("RELOAD", "False" if SERVER_MODE == "production" else "True").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+    if RELOAD and WORKERS > 1:
+        print("Auto-reload does not work with several workers, starting without it")
+        RELOAD = False
     
     print("Starting Crop Disease Identification API...")
     print(f"Documentation: http://{HOST}:{PORT}/docs")
@@ -572,11 +1846,15 @@ if __name__ == "__main__":
     print(f"  - OpenRouter API: {'✓ Configured' if OPENROUTER_API_KEY else '✗ Not configured'}")
     print(f"  - Upload Directory: {UPLOAD_DIR}")
     print(f"  - Max Image Size: {MAX_IMAGE_SIZE}px")
+    print(f"  - Mode: {SERVER_MODE}, {WORKERS} worker(s){', auto-reload' if RELOAD else ''}")
     
+    # Reload and multiple workers need an import string; a single worker serves
+    # this module's app directly rather than importing everything a second time
     uvicorn.run(
-        "main_fastapi:app",
+        "main_fastapi:app" if RELOAD or WORKERS > 1 else app,
         host=HOST,
         port=PORT,
         reload=RELOAD,
+        workers=WORKERS,
         log_level=LOG_LEVEL
     )
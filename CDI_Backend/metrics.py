@@ -0,0 +1,241 @@
+"""
+Prometheus Metrics
+------------------
+Minimal counters, gauges and histograms rendered in the Prometheus text
+exposition format, plus the metrics recorded by the analysis pipeline
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirror a count that is maintained elsewhere, e.g. cache statistics"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted((key, dict(state, buckets=list(state["buckets"]))) for key, state in self._values.items())
+        for label_values, state in items:
+            for bound, count in zip(self.buckets, state["buckets"]):
+                le = _format_labels(self.label_names, label_values, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _format_labels(self.label_names, label_values, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{le} {state['count']}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Register a callable run before each scrape to refresh derived metrics"""
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector error: {str(e)}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "cdi_stage_duration_seconds",
+    "Duration of each /analyze pipeline stage in seconds",
+    labels=("stage",)
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "cdi_http_requests_total",
+    "HTTP requests by method, route and status code",
+    labels=("method", "path", "status")
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "cdi_http_request_duration_seconds",
+    "HTTP request duration in seconds until the response starts",
+    labels=("method", "path")
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "cdi_http_requests_in_flight",
+    "HTTP requests currently being handled"
+))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "cdi_upstream_requests_in_flight",
+    "Upstream API calls currently in progress",
+    labels=("upstream",)
+))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "cdi_upstream_errors_total",
+    "Failed upstream API calls by upstream and error kind",
+    labels=("upstream", "kind")
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "cdi_cache_lookups_total",
+    "Diagnosis and treatment cache lookups by result",
+    labels=("cache", "result")
+))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "cdi_cache_entries",
+    "Entries held in the in-memory cache tier",
+    labels=("cache",)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "cdi_queue_depth",
+    "Work waiting in the image pool and job queue",
+    labels=("queue",)
+))
+TREATMENT_FALLBACKS = REGISTRY.register(Counter(
+    "cdi_treatment_fallbacks_total",
+    "Basic recommendations served instead of DeepSeek, by reason",
+    labels=("reason",)
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "cdi_coalesced_requests_total",
+    "Requests that joined an identical in-flight upstream call instead of making their own",
+    labels=("flight",)
+))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "cdi_circuit_breaker_state",
+    "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open",
+    labels=("upstream",)
+))
+HEDGED_REQUESTS = REGISTRY.register(Counter(
+    "cdi_hedged_requests_total",
+    "Backup DeepSeek requests started because the first was slow, by which request won",
+    labels=("winner",)
+))
+PRESCREEN_FLAGS = REGISTRY.register(Counter(
+    "cdi_prescreen_flags_total",
+    "Photos flagged by the local pre-screen, by reason and whether they were rejected or only warned about",
+    labels=("reason", "action")
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "cdi_startup_seconds",
+    "Cold start of this worker: module imports, time until warm and time until the first request was served",
+    labels=("phase",)
+))
@@ -0,0 +1,88 @@
+"""
+Upstream Resilience
+-------------------
+Circuit breakers that stop calling an upstream API after sustained failures,
+and per-request latency budgets
+"""
+
+import time
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    ``closed``: calls flow normally. After ``failure_threshold`` consecutive
+    failures the breaker becomes ``open`` and refuses calls for
+    ``reset_timeout`` seconds. It then turns ``half_open`` and lets a single
+    trial call through: success closes it again, failure re-opens it. A trial
+    that never reports back (e.g. it was cancelled) is given up on after
+    another ``reset_timeout``.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_started = None
+
+    def allow(self):
+        """Return True if a call may go ahead now"""
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._trial_started = None
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+            self._trial_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_started = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_started = None
+        if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            print(f"Circuit breaker for {self.name} opened after {self.consecutive_failures} consecutive failures")
+
+    def retry_after(self):
+        """Seconds until a trial call will be allowed, for Retry-After headers"""
+        if self.state != "open":
+            return 0
+        return max(0, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_after": self.retry_after(),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+def deadline_after(seconds):
+    """Monotonic deadline for a latency budget of ``seconds`` (None if unlimited)"""
+    return time.monotonic() + seconds if seconds and seconds > 0 else None
+
+
+def time_left(deadline):
+    """Seconds left before deadline (None if there is no deadline)"""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
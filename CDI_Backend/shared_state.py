@@ -0,0 +1,335 @@
+"""
+Shared Worker State
+-------------------
+SQLite database in WAL mode shared by the worker processes of one node: a
+cache tier, leases that let one worker call an upstream API while the others
+wait for its result, concurrency slots counted across workers, and the
+warm-up state of each worker
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Optional
+from serialization import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, published_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS workers (pid INTEGER PRIMARY KEY, started_at REAL NOT NULL, ready_at REAL, heartbeat REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS artifacts (analysis_id TEXT PRIMARY KEY, created_at REAL NOT NULL, size INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS artifacts_created_at ON artifacts (created_at);
+"""
+
+# Published flight results are only read by workers already waiting for them
+RESULT_RETENTION = 300
+
+
+class SharedState:
+    """One SQLite file per node, opened once per thread
+
+    WAL mode lets readers in every worker proceed while one worker writes.
+    All methods are blocking and meant to be called through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.owner = str(os.getpid())
+        self._local = threading.local()
+        self._publishes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # Cache entries
+
+    def cache_get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def cache_set(self, key: str, value: Any, ttl: float):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, dumps(value), time.time() + ttl)
+        )
+
+    def cache_delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def cache_prune(self, prefix: str, max_entries: int) -> int:
+        """Remove expired entries and the entries expiring soonest beyond max_entries; return the count"""
+        connection = self._connection()
+        pattern = prefix.replace("%", "\\%").replace("_", "\\_") + "%"
+        removed = connection.execute(
+            "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\' AND expires_at < ?", (pattern, time.time())
+        ).rowcount
+        removed += connection.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE key LIKE ? ESCAPE '\\' "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (pattern, max_entries)
+        ).rowcount
+        return removed
+
+    def cache_count(self, prefix: str) -> int:
+        pattern = prefix.replace("%", "\\%").replace("_", "\\_") + "%"
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE key LIKE ? ESCAPE '\\'", (pattern,)
+        ).fetchone()[0]
+
+    # Leases and published results
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """Take the lease on key unless another worker holds an unexpired one"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at < ?",
+            (key, self.owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        self._connection().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        """Take one of limit slot leases named name:0 .. name:limit-1; return its key, or None if all are held"""
+        # Start at a random slot so that workers do not all contend for slot 0
+        first = random.randrange(limit)
+        for offset in range(limit):
+            key = f"{name}:{(first + offset) % limit}"
+            if self.acquire_lease(key, ttl):
+                return key
+        return None
+
+    def count_slots(self, name: str, limit: int) -> int:
+        """Number of unexpired slot leases held under name"""
+        keys = [f"{name}:{index}" for index in range(limit)]
+        return self._connection().execute(
+            f"SELECT COUNT(*) FROM leases WHERE key IN ({', '.join('?' * limit)}) AND expires_at >= ?",
+            (*keys, time.time())
+        ).fetchone()[0]
+
+    def publish(self, key: str, value: Any):
+        """Make the result of a leased call available to the workers waiting for it"""
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO results (key, value, published_at) VALUES (?, ?, ?)",
+            (key, dumps(value), now)
+        )
+        self._publishes += 1
+        if self._publishes % 100 == 0:
+            connection.execute("DELETE FROM results WHERE published_at < ?", (now - RESULT_RETENTION,))
+
+    def result(self, key: str, since: float):
+        """Return (True, value) if a result for key was published at or after since, else (False, None)"""
+        row = self._connection().execute(
+            "SELECT value FROM results WHERE key = ? AND published_at >= ?", (key, since)
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, loads(row[0])
+
+    # Artifact retention index
+
+    def artifact_add(self, analysis_id: str, size: int, created_at: Optional[float] = None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO artifacts (analysis_id, created_at, size) VALUES (?, ?, ?)",
+            (analysis_id, created_at or time.time(), size)
+        )
+
+    def artifact_add_missing(self, entries: list):
+        """Index (created_at, analysis_id, size) entries found on disk that are not indexed yet"""
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO artifacts (created_at, analysis_id, size) VALUES (?, ?, ?)", entries
+        )
+
+    def artifact_expire(self, max_bytes: int, max_count: int, max_age: float) -> list:
+        """Remove the oldest artifacts from the index until size, count and age limits hold; return their ids
+
+        Runs in one write transaction, so concurrent workers never pick the same artifact.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            count, total_bytes = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+            cutoff = time.time() - max_age
+            expired = []
+            for analysis_id, created_at, size in connection.execute(
+                "SELECT analysis_id, created_at, size FROM artifacts ORDER BY created_at"
+            ):
+                if total_bytes <= max_bytes and count <= max_count and created_at >= cutoff:
+                    break
+                expired.append(analysis_id)
+                total_bytes -= size
+                count -= 1
+            connection.executemany("DELETE FROM artifacts WHERE analysis_id = ?", [(i,) for i in expired])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return expired
+
+    def artifact_totals(self):
+        """(count, total_bytes) of indexed artifacts"""
+        return tuple(self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+        ).fetchone())
+
+    # Worker warm-up
+
+    def register_worker(self):
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO workers (pid, started_at, ready_at, heartbeat) VALUES (?, ?, NULL, ?)",
+            (os.getpid(), now, now)
+        )
+
+    def mark_ready(self):
+        now = time.time()
+        self._connection().execute(
+            "UPDATE workers SET ready_at = ?, heartbeat = ? WHERE pid = ?", (now, now, os.getpid())
+        )
+
+    def heartbeat(self):
+        self._connection().execute("UPDATE workers SET heartbeat = ? WHERE pid = ?", (time.time(), os.getpid()))
+
+    def unregister_worker(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM workers WHERE pid = ?", (os.getpid(),))
+        # Leases and slots left behind by this worker would otherwise block others until they expire
+        connection.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+
+    def live_workers(self, stale_after: float) -> list:
+        """Workers that sent a heartbeat within stale_after seconds"""
+        rows = self._connection().execute(
+            "SELECT pid, started_at, ready_at FROM workers WHERE heartbeat >= ? ORDER BY pid",
+            (time.time() - stale_after,)
+        ).fetchall()
+        return [{"pid": pid, "started_at": started_at, "ready_at": ready_at} for pid, started_at, ready_at in rows]
+
+
+class SharedCache:
+    """Cache tier kept in SharedState, interchangeable with cache.DiskCache"""
+
+    def __init__(self, state: SharedState, namespace: str, max_entries: int = 10000, ttl: float = 86400):
+        self.state = state
+        self.prefix = f"{namespace}:"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.state.cache_get(self.prefix + key)
+
+    def set(self, key: str, value: Any):
+        self.state.cache_set(self.prefix + key, value, self.ttl)
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self.prune()
+
+    def prune(self):
+        self.evictions += self.state.cache_prune(self.prefix, self.max_entries)
+
+    def __len__(self):
+        return self.state.cache_count(self.prefix)
+
+
+class SharedSemaphore:
+    """Concurrency limit counted across the worker processes of a node
+
+    Each holder owns one of ``limit`` slot leases in SharedState. A worker
+    that dies while holding slots frees them after ``ttl`` seconds, so ttl
+    must exceed the longest guarded call. Waiting callers poll for a free
+    slot. If the database is unavailable, callers fall back to a local
+    semaphore of ``fallback_limit`` slots.
+    """
+
+    def __init__(self, state: SharedState, name: str, limit: int, ttl: float,
+                 poll_interval: float = 0.05, fallback_limit: Optional[int] = None):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._held = []
+        self._fallback = asyncio.Semaphore(fallback_limit or limit)
+
+    async def _take_slot(self) -> Optional[str]:
+        """One attempt at a slot; never leaks a slot when the caller is cancelled"""
+        attempt = asyncio.ensure_future(asyncio.to_thread(self.state.acquire_slot, self.name, self.limit, self.ttl))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            attempt.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, attempt):
+        if attempt.cancelled() or attempt.exception() is not None or attempt.result() is None:
+            return
+        asyncio.get_running_loop().run_in_executor(None, self._release_slot, attempt.result())
+
+    def _release_slot(self, slot: str):
+        try:
+            self.state.release_lease(slot)
+        except sqlite3.Error as e:
+            print(f"Could not release {self.name} slot, it expires in {self.ttl:.0f}s: {str(e)}")
+
+    async def acquire(self) -> bool:
+        delay = self.poll_interval
+        while True:
+            try:
+                slot = await self._take_slot()
+            except sqlite3.Error as e:
+                print(f"Shared state unavailable for {self.name}, limiting this worker only: {str(e)}")
+                await self._fallback.acquire()
+                self._held.append(None)
+                return True
+            if slot is not None:
+                self._held.append(slot)
+                return True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now"""
+        try:
+            slot = await self._take_slot()
+        except sqlite3.Error:
+            return False
+        if slot is None:
+            return False
+        self._held.append(slot)
+        return True
+
+    def release(self):
+        slot = self._held.pop()
+        if slot is None:
+            self._fallback.release()
+            return
+        # Callers release from synchronous code, so the delete runs in the default executor
+        asyncio.get_running_loop().run_in_executor(None, self._release_slot, slot)
+
+    def in_use(self) -> int:
+        return self.state.count_slots(self.name, self.limit)
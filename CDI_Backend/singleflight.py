@@ -0,0 +1,128 @@
+"""
+Single-flight Request Coalescing
+--------------------------------
+Concurrent calls for the same key share one in-flight upstream call and all
+receive its result (or its exception), within a worker process and, through
+a SharedState lease, across the worker processes of a node
+"""
+
+import time
+import sqlite3
+import asyncio
+from metrics import COALESCED_REQUESTS
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time
+
+    The first caller for a key starts the call; callers arriving while it is
+    still running wait for the same result. A waiting caller that is cancelled
+    (e.g. the client disconnected) does not cancel the call for the others,
+    but when every caller has been cancelled the call is cancelled too.
+
+    With ``shared`` (a shared_state.SharedState), a worker must also hold the
+    key's lease to make the call. Workers that find the lease taken poll for
+    the result the holder publishes, and make the call themselves if the
+    holder fails or its lease (``lease_ttl`` seconds) runs out. Results must
+    be JSON-serializable.
+    """
+
+    def __init__(self, name, enabled=True, shared=None, lease_ttl=60.0, poll_interval=0.05):
+        self.name = name
+        self.enabled = enabled
+        self.shared = shared
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.calls = 0
+        self.coalesced = 0
+        self.shared_coalesced = 0
+        self._in_flight = {}
+        self._waiters = {}
+
+    async def run(self, key, func, *args, timeout=None):
+        """Return ``await func(*args)``, sharing it with concurrent callers of ``key``
+
+        ``timeout`` only applies to waiting for a call started by someone
+        else, in this worker or another (the caller's own deadline is
+        expected to be passed to ``func``); asyncio.TimeoutError is raised if
+        it takes longer.
+        """
+        if not self.enabled:
+            return await func(*args)
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(self._call(key, func, args, timeout))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+            waiting = asyncio.shield(task)
+        else:
+            self.coalesced += 1
+            COALESCED_REQUESTS.inc(flight=self.name)
+            waiting = asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await waiting
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                # Nobody is left to receive the result
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+
+    async def _call(self, key, func, args, timeout):
+        """Make the call once this worker holds the key's lease, or return another worker's result"""
+        if self.shared is None:
+            return await func(*args)
+
+        lease_key = f"{self.name}:{key!r}"
+        waiting_since = time.time()
+        started = time.monotonic()
+        try:
+            while not await asyncio.to_thread(self.shared.acquire_lease, lease_key, self.lease_ttl):
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(self.poll_interval)
+                found, result = await asyncio.to_thread(self.shared.result, lease_key, waiting_since)
+                if found:
+                    self.shared_coalesced += 1
+                    COALESCED_REQUESTS.inc(flight=self.name)
+                    return result
+        except sqlite3.Error as e:
+            print(f"Shared state unavailable for {self.name}, calling upstream directly: {str(e)}")
+            return await func(*args)
+
+        try:
+            # The previous holder may have published just before releasing the lease
+            found, result = await asyncio.to_thread(self.shared.result, lease_key, waiting_since)
+            if found:
+                self.shared_coalesced += 1
+                COALESCED_REQUESTS.inc(flight=self.name)
+                return result
+            result = await func(*args)
+            try:
+                await asyncio.to_thread(self.shared.publish, lease_key, result)
+            except sqlite3.Error as e:
+                print(f"Could not publish {self.name} result: {str(e)}")
+            return result
+        finally:
+            try:
+                await asyncio.to_thread(self.shared.release_lease, lease_key)
+            except sqlite3.Error as e:
+                print(f"Could not release {self.name} lease: {str(e)}")
+
+    def stats(self):
+        stats = {
+            "enabled": self.enabled,
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced
+        }
+        if self.shared is not None:
+            stats["shared_coalesced"] = self.shared_coalesced
+        return stats
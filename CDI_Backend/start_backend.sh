@@ -17,7 +17,7 @@ echo ".env file found, loading configuration..."
 
 # Install requirements if needed
 echo "Checking Python dependencies..."
-pip install -q python-dotenv fastapi uvicorn pillow requests openai
+pip install -q python-dotenv fastapi uvicorn pillow requests httpx openai
 
 # Start the FastAPI server
 echo "Starting CDI Backend API server..."
@@ -0,0 +1,93 @@
+"""
+Startup Timing
+--------------
+Cold start report for a worker: import time per module (including
+modules imported lazily after startup), time until the worker finished
+warming up and time until its first request was served
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Collects startup timings relative to the moment it was created"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = {}
+        self.lazy_imports = {}
+        self.ready_ms = None
+        self.first_request = None
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    @contextmanager
+    def importing(self, name, lazy=False):
+        """Time the imports in the block under name; lazy imports are listed separately
+
+        Only the first timing of a name is kept: when the app module is
+        imported a second time its imports are already cached.
+        """
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self.lazy_imports if lazy else self.imports
+            timings.setdefault(name, round((time.perf_counter() - began) * 1000, 2))
+
+    def mark_ready(self):
+        if self.ready_ms is None:
+            self.ready_ms = self.elapsed_ms()
+
+    def mark_first_request(self, path, duration_ms):
+        """Record the first request served; return True the first time only"""
+        if self.first_request is not None:
+            return False
+        self.first_request = {
+            "path": path,
+            "served_after_ms": self.elapsed_ms(),
+            "duration_ms": round(duration_ms, 2)
+        }
+        return True
+
+    def report(self):
+        return {
+            "imports_ms": self.imports,
+            "lazy_imports_ms": self.lazy_imports,
+            "ready_after_ms": self.ready_ms,
+            "first_request": self.first_request
+        }
+
+    def summary(self):
+        """One-line report for the log"""
+        imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.imports.items())
+        lazy_imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.lazy_imports.items())
+        line = f"Startup timing: imports [{imports}]"
+        if lazy_imports:
+            line += f", background imports [{lazy_imports}]"
+        if self.ready_ms is not None:
+            line += f", warm after {self.ready_ms:.0f}ms"
+        if self.first_request is not None:
+            line += (
+                f", first request {self.first_request['path']} served after "
+                f"{self.first_request['served_after_ms']:.0f}ms (took {self.first_request['duration_ms']:.0f}ms)"
+            )
+        return line
+
+
+_process_timer = None
+
+
+def process_timer():
+    """Return the StartupTimer for this process, created on first use
+
+    uvicorn imports "main_fastapi:app" again when main_fastapi.py was run as
+    a script (with reload or several workers); sharing the timer keeps the
+    timings taken by the first import.
+    """
+    global _process_timer
+    if _process_timer is None:
+        _process_timer = StartupTimer()
+    return _process_timer
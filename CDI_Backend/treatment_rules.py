@@ -0,0 +1,227 @@
+"""
+Basic Treatment Rules
+---------------------
+Rule table for the basic treatment recommendations used when DeepSeek is
+unavailable. Rules are loaded from a JSON file, compiled into a keyword index
+that finds every matching keyword in a single pass over a name, and rendered
+from precomputed text fragments. The file is reloaded when it changes.
+"""
+
+import os
+import json
+import time
+import threading
+from functools import lru_cache
+
+
+class KeywordIndex:
+    """Aho-Corasick automaton mapping substrings of a name to rule priorities
+
+    Each keyword belongs to a rule; earlier rules win, as in an if/elif
+    chain. ``first_match`` scans the text once and returns the index of the
+    earliest rule with a keyword anywhere in it, or None.
+    """
+
+    def __init__(self, rules_keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+        for rule_index, keywords in enumerate(rules_keywords):
+            for keyword in keywords:
+                self._add(keyword.lower(), rule_index)
+        self._link()
+
+    def _add(self, keyword, rule_index):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            state = next_state
+        if self._best[state] is None or rule_index < self._best[state]:
+            self._best[state] = rule_index
+
+    def _link(self):
+        """Compute failure links breadth-first and fold in the best rule of each suffix"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                inherited = self._best[self._fail[next_state]]
+                if inherited is not None and (self._best[next_state] is None or inherited < self._best[next_state]):
+                    self._best[next_state] = inherited
+                queue.append(next_state)
+
+    def first_match(self, text):
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state = 0
+        best = None
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = best_at[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+
+def bullet_lines(items):
+    return "".join(f"- {item}\n" for item in items)
+
+
+class TreatmentRuleTable:
+    """Compiled, immutable form of one rule file"""
+
+    def __init__(self, rules):
+        diseases = rules["diseases"]
+        healthy = rules["healthy"]
+        crops = rules["crops"]
+
+        self.disease_rule_count = len(diseases["rules"])
+        self.crop_rule_count = len(crops["rules"])
+
+        # Fragments are rendered once here so that a recommendation is a join of ready-made strings
+        self.header = f"{rules['header']}\n\n"
+        self.disease_heading = f"{diseases['heading']}\n"
+        self.disease_advice = [f": {rule['advice']}\n" for rule in diseases["rules"]]
+        self.disease_default = f": {diseases['default']}\n"
+        self.disease_general = f"\n{diseases['general_heading']}\n{bullet_lines(diseases['general'])}"
+        self.healthy = (
+            f"{healthy['status']}\n{healthy['message']}\n\n"
+            f"{healthy['tips_heading']}\n{bullet_lines(healthy['tips'])}"
+        )
+        self.crop_heading = crops["heading"]
+        self.crop_tips = [bullet_lines(rule["tips"]) for rule in crops["rules"]]
+        self.crop_default = bullet_lines(crops["default"])
+        self.footer = f"\n{rules['footer']}"
+
+        self._disease_index = KeywordIndex([rule["keywords"] for rule in diseases["rules"]])
+        self._crop_index = KeywordIndex([rule["keywords"] for rule in crops["rules"]])
+        # The same few names recur constantly, so remember their fragments
+        self.advice_for = lru_cache(maxsize=4096)(self._advice_for)
+        self.tips_for = lru_cache(maxsize=4096)(self._tips_for)
+
+    def _advice_for(self, disease_name):
+        match = self._disease_index.first_match(disease_name.lower())
+        return self.disease_default if match is None else self.disease_advice[match]
+
+    def _tips_for(self, crop_name):
+        match = self._crop_index.first_match(crop_name.lower())
+        return self.crop_default if match is None else self.crop_tips[match]
+
+    def render(self, crops, diseases):
+        """Build the recommendation text for one diagnosis"""
+        parts = [self.header]
+        if diseases:
+            parts.append(self.disease_heading)
+            for disease in diseases:
+                parts.append(f"- {disease['name']}")
+                parts.append(self.advice_for(disease['name']))
+            parts.append(self.disease_general)
+        else:
+            parts.append(self.healthy)
+
+        if crops:
+            crop_name = crops[0]['name']
+            parts.append(f"\n{self.crop_heading.format(crop=crop_name)}\n")
+            parts.append(self.tips_for(crop_name))
+
+        parts.append(self.footer)
+        return "".join(parts)
+
+
+class TreatmentRuleBook:
+    """Loads the rule file and recompiles it when the file changes
+
+    The file's modification time is checked at most every ``reload_interval``
+    seconds (0 disables hot reload). A file that fails to load is reported
+    and the previous rules stay in use.
+    """
+
+    def __init__(self, path, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.reload_errors = 0
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(path)
+        self.table = self._load()
+        self.loaded_at = time.time()
+        self._checked_at = time.monotonic()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return TreatmentRuleTable(json.load(f))
+
+    def reload_if_changed(self):
+        """Recompile the rules if the file changed since it was last loaded"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return False
+            if mtime == self._mtime:
+                return False
+            # Report a broken edit once rather than on every check
+            self._mtime = mtime
+            try:
+                table = self._load()
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.reload_errors += 1
+                print(f"Treatment rules reload failed, keeping previous rules: {str(e)}")
+                return False
+            self.table = table
+            self.loaded_at = time.time()
+            self.reloads += 1
+            print(f"Treatment rules reloaded from {self.path}")
+            return True
+
+    def current(self):
+        """Return the compiled rules, checking the file for changes if it is time to"""
+        if self.reload_interval and time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload_if_changed()
+        return self.table
+
+    def render(self, crops, diseases):
+        return self.current().render(crops, diseases)
+
+    def render_batch(self, diagnoses, table=None):
+        """Render recommendations for many (crops, diseases) pairs from one rule snapshot
+
+        ``table`` is a snapshot from current(), so that a batch whose images
+        finish at different times is not split across a reload; by default
+        one is taken for this call. Pairs naming the same diseases and
+        leading crop are rendered once.
+        """
+        table = table or self.current()
+        rendered = {}
+        results = []
+        for crops, diseases in diagnoses:
+            key = (crops[0]['name'] if crops else None, tuple(disease['name'] for disease in diseases))
+            if key not in rendered:
+                rendered[key] = table.render(crops, diseases)
+            results.append(rendered[key])
+        return results
+
+    def stats(self):
+        table = self.table
+        return {
+            "path": self.path,
+            "disease_rules": table.disease_rule_count,
+            "crop_rules": table.crop_rule_count,
+            "loaded_at": self.loaded_at,
+            "reload_interval": self.reload_interval,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors
+        }
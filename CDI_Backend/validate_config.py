@@ -31,10 +31,62 @@ def validate_backend_config():
         "HOST": ("0.0.0.0", "FastAPI server host"),
         "PORT": ("8000", "FastAPI server port"),
         "RELOAD": ("True", "Enable auto-reload in development"),
+        "SERVER_MODE": ("development", "development or production"),
+        "WORKERS": ("1", "Server worker processes (production default: one per core)"),
+        "SHARED_STATE_DB": ("uploads/shared_state.db", "SQLite file shared by several workers"),
+        "SHARED_LEASE_TTL": ("60", "Seconds a worker may hold an upstream call lease"),
+        "SHARED_POLL_INTERVAL": ("0.05", "Seconds between checks for another worker's result"),
         "LOG_LEVEL": ("info", "Logging level"),
         "UPLOAD_DIR": ("uploads", "Directory for uploaded files"),
         "MAX_IMAGE_SIZE": ("1024", "Maximum image size in pixels"),
-        "JPEG_QUALITY": ("95", "JPEG compression quality")
+        "JPEG_QUALITY": ("95", "JPEG compression quality"),
+        "MAX_UPLOAD_MB": ("20", "Largest accepted image upload in MB"),
+        "IMAGE_ENCODING_MODE": ("fixed", "Image encoding: fixed quality or adaptive to a byte budget"),
+        "IMAGE_TARGET_BYTES": ("300000", "Adaptive mode: maximum base64 payload sent to KindWise"),
+        "IMAGE_MIN_QUALITY": ("70", "Adaptive mode: lowest JPEG quality allowed"),
+        "IMAGE_MIN_SIZE": ("640", "Adaptive mode: smallest longest side in pixels"),
+        "HTTP_CONNECT_TIMEOUT": ("5", "Upstream connect timeout in seconds"),
+        "HTTP_READ_TIMEOUT": ("30", "Upstream read timeout in seconds"),
+        "HTTP_POOL_TIMEOUT": ("10", "Seconds to wait for a pooled connection"),
+        "HTTP_MAX_CONNECTIONS": ("100", "Maximum open upstream connections"),
+        "HTTP_MAX_KEEPALIVE": ("20", "Maximum idle keep-alive connections"),
+        "HTTP_KEEPALIVE_EXPIRY": ("30", "Seconds an idle connection is kept open"),
+        "DEEPSEEK_MAX_CONCURRENCY": ("8", "Maximum simultaneous DeepSeek calls"),
+        "DEEPSEEK_QUEUE_TIMEOUT": ("2", "Seconds to wait for a free DeepSeek slot"),
+        "DEEPSEEK_TIMEOUT": ("20", "Per-call DeepSeek timeout in seconds"),
+        "DIAGNOSIS_CACHE_ENABLED": ("True", "Reuse results for identical images"),
+        "DIAGNOSIS_CACHE_MAX_ENTRIES": ("512", "In-memory diagnosis cache capacity"),
+        "DIAGNOSIS_CACHE_TTL": ("86400", "Seconds a cached diagnosis stays valid"),
+        "DIAGNOSIS_CACHE_DIR": ("", "Directory for the on-disk diagnosis cache"),
+        "DIAGNOSIS_CACHE_DISK_MAX_ENTRIES": ("5000", "On-disk diagnosis cache capacity"),
+        "TREATMENT_CACHE_ENABLED": ("True", "Reuse AI treatments for the same diagnosis"),
+        "TREATMENT_CACHE_MAX_ENTRIES": ("1024", "Treatment cache capacity"),
+        "TREATMENT_CACHE_TTL": ("604800", "Seconds a cached treatment stays valid"),
+        "IMAGE_POOL_KIND": ("process", "Image preprocessing pool: process, thread or inline"),
+        "IMAGE_POOL_WORKERS": ("0", "Image worker count (0 = one per CPU core)"),
+        "IMAGE_QUEUE_LIMIT": ("32", "Images allowed to wait for preprocessing"),
+        "BATCH_MAX_FILES": ("200", "Maximum images per batch request"),
+        "BATCH_CONCURRENCY": ("8", "Images analyzed at once within a batch"),
+        "JOB_WORKERS": ("4", "Background workers processing /jobs"),
+        "JOB_QUEUE_DEPTH": ("100", "Jobs allowed to wait in the queue"),
+        "JOB_RESULT_TTL": ("3600", "Seconds finished job results are kept"),
+        "ARTIFACT_MAX_MB": ("500", "Total size of stored analyses in MB"),
+        "ARTIFACT_MAX_AGE": ("604800", "Seconds a stored analysis is kept"),
+        "ARTIFACT_MAX_COUNT": ("10000", "Maximum number of stored analyses"),
+        "COALESCE_ENABLED": ("True", "Share in-flight upstream calls between identical requests"),
+        "ANALYZE_BUDGET": ("40", "End-to-end latency budget per analysis in seconds (0 = unlimited)"),
+        "DEEPSEEK_MIN_BUDGET": ("2", "Budget seconds needed to still try DeepSeek"),
+        "DEEPSEEK_HEDGE_DELAY": ("0", "Seconds before a backup DeepSeek request (0 = off)"),
+        "BREAKER_FAILURE_THRESHOLD": ("5", "Consecutive upstream failures that open a circuit breaker"),
+        "BREAKER_RESET_TIMEOUT": ("30", "Seconds an open circuit breaker waits before a trial call"),
+        "TREATMENT_RULES_FILE": ("treatment_rules.json", "Rule table for basic treatment recommendations"),
+        "TREATMENT_RULES_RELOAD_INTERVAL": ("5", "Seconds between checks for rule file changes (0 = off)"),
+        "PRESCREEN_MODE": ("warn", "Photo quality pre-screen: off, warn or reject"),
+        "PRESCREEN_SIZE": ("256", "Size of the copy the pre-screen runs on"),
+        "PRESCREEN_BLUR_THRESHOLD": ("60", "Minimum Laplacian variance of a sharp photo"),
+        "PRESCREEN_MIN_BRIGHTNESS": ("35", "Minimum mean brightness (0-255)"),
+        "PRESCREEN_MAX_BRIGHTNESS": ("230", "Maximum mean brightness (0-255)"),
+        "PRESCREEN_MIN_PLANT_RATIO": ("0", "Minimum share of plant-coloured pixels (0 = no_plant check off)")
     }
     
     all_good = True
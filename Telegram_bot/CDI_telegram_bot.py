@@ -1,28 +1,119 @@
 import os 
 import json 
-import requests 
+import hmac
+import time
 import asyncio
+import threading
+import importlib.util
 from io import BytesIO 
-from telegram import Update 
-from telegram.ext import (
-    ApplicationBuilder, 
-    MessageHandler, 
-    ContextTypes, 
-    CommandHandler, 
-    filters,
-)
-from telegram.error import TimedOut, NetworkError, BadRequest
-from openai import OpenAI
-from dotenv import load_doten
-load_dotenv()
+from contextlib import contextmanager, asynccontextmanager
+
+# ====== STARTUP TIMING ======
+
+# Cold start report: import time per module, time until the clients were
+# warmed up in the background and time until the first update arrived.
+# openai is imported lazily, after polling has started.
+STARTED = time.perf_counter()
+IMPORT_TIMES = {}
+LAZY_IMPORT_TIMES = {}
+STARTUP_EVENTS = {}
 
-print("🔍 Debug: Environment variables loaded")
-print(f"🔍 Debug: OPENROUTER_API_KEY = {os.getenv('OPENROUTER_API_KEY')}")
-print(f"🔍 Debug: AI_SERVICE = {os.getenv('AI_SERVICE')}")
+def elapsed_ms():
+    return round((time.perf_counter() - STARTED) * 1000, 2)
+
+@contextmanager
+def timed_import(name, lazy=False):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        (LAZY_IMPORT_TIMES if lazy else IMPORT_TIMES)[name] = round((time.perf_counter() - began) * 1000, 2)
+
+def startup_summary():
+    imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in IMPORT_TIMES.items())
+    lazy_imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in LAZY_IMPORT_TIMES.items())
+    line = f"⏱️ Startup timing: imports [{imports}]"
+    if lazy_imports:
+        line += f", background imports [{lazy_imports}]"
+    for event, ms in STARTUP_EVENTS.items():
+        line += f", {event} after {ms:.0f}ms"
+    return line
+
+with timed_import("telegram"):
+    from telegram import Update 
+    from telegram.ext import (
+        ApplicationBuilder, 
+        MessageHandler, 
+        ContextTypes, 
+        CommandHandler, 
+        TypeHandler,
+        filters,
+    )
+    from telegram.error import TimedOut, NetworkError, BadRequest, RetryAfter, TelegramError
+with timed_import("httpx"):
+    import httpx
+with timed_import("dotenv"):
+    from dotenv import load_dotenv
+from conversation_memory import ConversationMemory
+load_dotenv()
 
 # ====== CONFIG ======
 
 FASTAPI_BACKEND_URL = os.getenv("FASTAPI_BACKEND_URL", "http://localhost:8000/analyze")
+
+# Backend calls share one pooled async HTTP client; each stage has its own timeout
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_WRITE_TIMEOUT = float(os.getenv("BACKEND_WRITE_TIMEOUT", "15"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "45"))
+BACKEND_POOL_TIMEOUT = float(os.getenv("BACKEND_POOL_TIMEOUT", "10"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "64"))
+# Retries for connection failures and 502/503/504 answers, with exponential backoff
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_RETRY_BACKOFF = float(os.getenv("BACKEND_RETRY_BACKOFF", "1"))
+
+# Text model limits: calls in flight across all users, seconds to wait for a
+# free slot and seconds allowed per call before a fallback message is sent
+TEXT_AI_MAX_CONCURRENCY = int(os.getenv("TEXT_AI_MAX_CONCURRENCY", "16"))
+TEXT_AI_QUEUE_TIMEOUT = float(os.getenv("TEXT_AI_QUEUE_TIMEOUT", "30"))
+TEXT_AI_TIMEOUT = float(os.getenv("TEXT_AI_TIMEOUT", "45"))
+
+# Streamed replies: the answer is edited into a placeholder message as it is
+# generated, at most once per STREAM_EDIT_INTERVAL seconds (Telegram allows
+# about one edit per second in a chat)
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Telegram: photo download timeout and retries, updates handled at once and
+# connections for Bot API calls
+TELEGRAM_DOWNLOAD_TIMEOUT = float(os.getenv("TELEGRAM_DOWNLOAD_TIMEOUT", "30"))
+TELEGRAM_DOWNLOAD_RETRIES = int(os.getenv("TELEGRAM_DOWNLOAD_RETRIES", "3"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "30"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+# Bot API endpoints; point them at a local fake server for testing
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_URL = os.getenv("TELEGRAM_FILE_URL", "https://api.telegram.org/file/bot")
+
+# Serving mode: "polling" (default) or "webhook". In webhook mode Telegram
+# posts updates to WEBHOOK_URL + WEBHOOK_PATH, served by an embedded web
+# server on WEBHOOK_HOST:WEBHOOK_PORT, so several bot processes can run
+# behind a load balancer. WEBHOOK_SECRET is required and checked on every
+# request; with several processes set WEBHOOK_REGISTER=false on all but one
+# and MEMORY_DB to share conversations.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "true").lower() == "true"
+# Parallel deliveries Telegram makes to this URL (1-100), requests the server
+# accepts at once before answering 503, and seconds to finish in-flight
+# updates on shutdown
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", "30"))
 AI_SERVICE = os.getenv("AI_SERVICE", "openrouter")
 
 # OpenRouter Configuration
@@ -35,11 +126,28 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE = "https://api.openai.com/v1"
 OPENAI_MODEL = "gpt-3.5-turbo"
 
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "7565138619:AAH2XJA-iXvE_q4nEhltGyn6tBYLYV383xw")
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
 # ====== MEMORY ======
 
-user_memory = {}
+# Users remembered in process (least recently active dropped first), seconds
+# a conversation is kept, turns stored per user and the token budget for the
+# history sent with each question. MEMORY_DB adds a SQLite file that keeps
+# conversations across restarts and shares them between bot processes.
+MEMORY_MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "1000"))
+MEMORY_TTL = int(os.getenv("MEMORY_TTL", "86400"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "10"))
+MEMORY_HISTORY_TOKENS = int(os.getenv("MEMORY_HISTORY_TOKENS", "1500"))
+MEMORY_DB = os.getenv("MEMORY_DB", "")
+
+user_memory = ConversationMemory(
+    max_users=MEMORY_MAX_USERS,
+    ttl=MEMORY_TTL,
+    max_turns=MEMORY_MAX_TURNS,
+    db_path=MEMORY_DB or None
+)
+print(f"🧠 Memory: {MEMORY_MAX_USERS} users, {MEMORY_TTL}s TTL, {MEMORY_HISTORY_TOKENS} history tokens"
+      + (f", persisted to {MEMORY_DB}" if MEMORY_DB else ", in process only"))
 
 # ====== TEXT AI CLIENT ======
 
@@ -53,26 +161,171 @@ else:  # Default to OpenRouter
     TEXT_AI_BASE = OPENROUTER_BASE
     TEXT_AI_MODEL = OPENROUTER_MODEL
 
-print(f"🔍 Debug: Using AI service: {AI_SERVICE}")
-print(f"🔍 Debug: TEXT_AI_KEY = {TEXT_AI_KEY}")
-print(f"🔍 Debug: TEXT_AI_BASE = {TEXT_AI_BASE}")
-print(f"🔍 Debug: TEXT_AI_MODEL = {TEXT_AI_MODEL}")
-
-# Create OpenAI client with additional headers for OpenRouter
-if AI_SERVICE == "openrouter":
-    text_ai = OpenAI(
-        api_key=TEXT_AI_KEY,
-        base_url=TEXT_AI_BASE,
-        default_headers={
-            "HTTP-Referer": "https://github.com/your-repo",  # Optional
-            "X-Title": "CDI Telegram Bot"  # Optional
-        }
-    )
-else:
-    text_ai = OpenAI(
-        api_key=TEXT_AI_KEY, 
-        base_url=TEXT_AI_BASE
-    )
+# The OpenAI client is created on first use (normally by the background
+# warm-up), since importing openai dominates the bot's cold start
+text_ai = None
+text_ai_lock = threading.Lock()
+
+def get_text_ai():
+    global text_ai
+    if text_ai is None:
+        with text_ai_lock:
+            if text_ai is None:
+                with timed_import("openai", lazy=True):
+                    from openai import AsyncOpenAI
+                # Create OpenAI client with additional headers for OpenRouter
+                if AI_SERVICE == "openrouter":
+                    text_ai = AsyncOpenAI(
+                        api_key=TEXT_AI_KEY,
+                        base_url=TEXT_AI_BASE,
+                        timeout=TEXT_AI_TIMEOUT,
+                        max_retries=1,
+                        default_headers={
+                            "HTTP-Referer": "https://github.com/your-repo",  # Optional
+                            "X-Title": "CDI Telegram Bot"  # Optional
+                        }
+                    )
+                else:
+                    text_ai = AsyncOpenAI(
+                        api_key=TEXT_AI_KEY, 
+                        base_url=TEXT_AI_BASE,
+                        timeout=TEXT_AI_TIMEOUT,
+                        max_retries=1
+                    )
+    return text_ai
+
+# ====== TEXT AI LIMITS ======
+
+# Shared by all users; a user's later questions queue behind their first
+text_ai_slots = asyncio.Semaphore(TEXT_AI_MAX_CONCURRENCY)
+user_turns = {}
+
+TEXT_AI_BUSY_MESSAGE = "⏳ The assistant is very busy right now. Please try again in a minute."
+TEXT_AI_TIMEOUT_MESSAGE = "⏱️ The assistant took too long to answer. Please try again, or ask a shorter question."
+TEXT_AI_CUT_SHORT_MESSAGE = "⏱️ The answer was cut short because the assistant took too long."
+TEXT_AI_INTERRUPTED_MESSAGE = "⚠️ The answer was interrupted by a connection problem. Please ask again for the rest."
+
+def user_busy(user_id):
+    """True while a conversation turn for this user is running or queued"""
+    return user_id in user_turns
+
+@asynccontextmanager
+async def user_turn(user_id):
+    """Run one conversation turn per user at a time, the rest in arrival order"""
+    turn = user_turns.get(user_id)
+    if turn is None:
+        turn = user_turns[user_id] = {"lock": asyncio.Lock(), "waiting": 0}
+    turn["waiting"] += 1
+    try:
+        async with turn["lock"]:
+            yield
+    finally:
+        turn["waiting"] -= 1
+        if turn["waiting"] == 0:
+            del user_turns[user_id]
+
+# ====== BACKEND CLIENT ======
+
+backend_client = None
+backend_client_lock = threading.Lock()
+
+# Answers worth retrying: the backend is restarting, overloaded or its upstream is down
+RETRYABLE_STATUSES = {502, 503, 504}
+
+def get_backend_client():
+    global backend_client
+    with backend_client_lock:
+        if backend_client is None or backend_client.is_closed:
+            backend_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    connect=BACKEND_CONNECT_TIMEOUT,
+                    write=BACKEND_WRITE_TIMEOUT,
+                    read=BACKEND_READ_TIMEOUT,
+                    pool=BACKEND_POOL_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=BACKEND_MAX_CONNECTIONS,
+                    max_keepalive_connections=BACKEND_MAX_CONNECTIONS
+                )
+            )
+    return backend_client
+
+def retry_delay(attempt, response=None):
+    """Seconds to wait before the next attempt, honouring a short Retry-After"""
+    if response is not None:
+        try:
+            return min(float(response.headers.get("Retry-After", "")), 10.0)
+        except ValueError:
+            pass
+    return BACKEND_RETRY_BACKOFF * 2 ** attempt
+
+async def analyze_image(image_bytes):
+    """Send a photo to the backend and return its JSON result
+
+    Connection failures and 502/503/504 answers are retried up to
+    BACKEND_RETRIES times; other errors are raised as httpx exceptions.
+    """
+    client = get_backend_client()
+    for attempt in range(BACKEND_RETRIES + 1):
+        last_attempt = attempt == BACKEND_RETRIES
+        try:
+            files = {'file': ('image.jpg', BytesIO(image_bytes), 'image/jpeg')}
+            response = await client.post(FASTAPI_BACKEND_URL, files=files)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            if last_attempt:
+                raise
+            delay = retry_delay(attempt)
+            print(f"Backend connection failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            continue
+        if response.status_code in RETRYABLE_STATUSES and not last_attempt:
+            delay = retry_delay(attempt, response)
+            print(f"Backend answered {response.status_code}, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            continue
+        response.raise_for_status()
+        return response.json()
+
+def backend_error_message(response):
+    """User-facing text for an error answer from the backend"""
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = None
+    if isinstance(detail, dict):
+        detail = detail.get("message")
+    if response.status_code in (413, 422) and detail:
+        # e.g. the photo is too large or failed the backend's quality check
+        return f"📷 {detail}"
+    if response.status_code in RETRYABLE_STATUSES:
+        return "⏳ The analysis service is busy right now. Please try again in a minute."
+    return f"❌ Error analyzing image: {detail or response.status_code}"
+
+def warm_up_clients():
+    get_backend_client()
+    if TEXT_AI_KEY:
+        get_text_ai()
+
+async def warm_up():
+    """Create the clients in the background once the bot is up, then print the startup report"""
+    try:
+        await asyncio.to_thread(warm_up_clients)
+    except Exception as e:
+        print(f"⚠️ Client warm-up failed: {e}")
+    STARTUP_EVENTS["warm"] = elapsed_ms()
+    print(startup_summary())
+
+warm_up_task = None
+
+async def start_background_warm_up(application):
+    global warm_up_task
+    # post_init runs before the application starts, when Application.create_task
+    # would warn, and nothing needs to wait for the warm-up on shutdown anyway
+    warm_up_task = asyncio.create_task(warm_up())
+
+async def close_clients(application):
+    if backend_client is not None:
+        await backend_client.aclose()
 
 # ====== HELPERS ======
 
@@ -124,16 +377,157 @@ def build_summary(result):
     
     return summary.strip()
 
-async def query_text_model(prompt):
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Split text into Telegram-sized parts, preferring line and word breaks"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+def retry_after_seconds(error):
+    """RetryAfter.retry_after is an int or a timedelta depending on the library version"""
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+class StreamedReply:
+    """Placeholder message that is edited in place while an answer streams in
+
+    Telegram errors never reach the caller: if the placeholder cannot be
+    edited (deleted, flood limits, ...) streaming edits stop and finish()
+    sends the answer as new messages instead.
+    """
+
+    def __init__(self, message, placeholder):
+        self.message = message
+        self.placeholder = placeholder
+        self.sent = None
+        self.shown = placeholder
+        self.next_edit = 0.0
+        self.edits = 0
+        self.failed = False
+
+    async def start(self):
+        self.sent = await self.message.reply_text(self.placeholder)
+        self.next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+
+    async def update(self, text):
+        """Show the text so far, unless the last edit was too recent"""
+        if self.failed or time.monotonic() < self.next_edit:
+            return
+        # Only the first message is edited while streaming; finish() sends the rest
+        await self.edit(text[:TELEGRAM_MESSAGE_LIMIT - 2] + " ▌")
+
+    async def edit(self, text):
+        """Edit the placeholder; return False if Telegram asked to slow down
+
+        Any other failure sets self.failed and returns True.
+        """
+        if text == self.shown:
+            return True
+        self.next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+        try:
+            await self.sent.edit_text(text)
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            print(f"⏳ Telegram asked to wait {delay:g}s before the next edit")
+            self.next_edit = time.monotonic() + delay
+            return False
+        except BadRequest as e:
+            # Happens when the text did not change after trimming
+            if "not modified" not in str(e).lower():
+                print(f"⚠️ Could not edit the reply, sending it as a new message: {e}")
+                self.failed = True
+                return True
+        except TelegramError as e:
+            print(f"⚠️ Could not edit the reply, sending it as a new message: {e}")
+            self.failed = True
+            return True
+        self.shown = text
+        self.edits += 1
+        return True
+
+    async def finish(self, text):
+        """Replace the placeholder with the final text, sending any overflow as new messages"""
+        parts = split_message(text)
+        while not self.failed and not await self.edit(parts[0]):
+            await asyncio.sleep(max(0.0, self.next_edit - time.monotonic()))
+        if self.failed:
+            # The placeholder is gone or stuck; the chat still gets the whole answer
+            for part in parts:
+                await self.message.chat.send_message(part)
+            return
+        for part in parts[1:]:
+            await self.message.reply_text(part)
+
+async def reply_from_text_model(message, prompt, placeholder, history=None):
+    """Answer with the text model, streamed into a placeholder message when enabled; return the answer"""
+    if not STREAM_REPLIES:
+        await message.reply_text(placeholder)
+        ai_response = await query_text_model(prompt, history=history)
+        for part in split_message(ai_response):
+            await message.reply_text(part)
+        return ai_response
+
+    reply = StreamedReply(message, placeholder)
+    await reply.start()
+    started = time.perf_counter()
+    ai_response = await query_text_model(prompt, on_text=reply.update, history=history)
+    await reply.finish(ai_response)
+    print(f"📨 Streamed reply in {time.perf_counter() - started:.1f}s with {reply.edits} edits")
+    return ai_response
+
+def is_model_answer(text):
+    """False for the configuration, busy, timeout and error messages returned instead of an answer"""
+    return not text.startswith(("⚠️", "⏱️", "⏳"))
+
+async def query_text_model(prompt, on_text=None, history=None):
+    # Check if API key is set
+    if not TEXT_AI_KEY or TEXT_AI_KEY == "YOUR_NEW_OPENROUTER_API_KEY_HERE":
+        return "⚠️ AI service not configured. Please set a valid API key in your .env file."
+    
+    try:
+        await asyncio.wait_for(text_ai_slots.acquire(), timeout=TEXT_AI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ No text model slot free after {TEXT_AI_QUEUE_TIMEOUT:g}s")
+        return TEXT_AI_BUSY_MESSAGE
+    try:
+        return await request_text_model(prompt, on_text, history)
+    finally:
+        text_ai_slots.release()
+
+async def stream_text_model(client, messages, chunks, on_text):
+    """Stream a completion into chunks, calling on_text with the text so far
+
+    Errors raised by on_text only affect what is shown, never the stream.
+    """
+    stream = await client.chat.completions.create(
+        model=TEXT_AI_MODEL,
+        messages=messages,
+        max_tokens=600,
+        temperature=0.3,
+        stream=True
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+                try:
+                    await on_text("".join(chunks))
+                except Exception as e:
+                    print(f"⚠️ Could not show the partial answer: {e}")
+    finally:
+        await stream.response.aclose()
+
+async def request_text_model(prompt, on_text=None, history=None):
     try:
-        # Check if API key is set
-        if not TEXT_AI_KEY or TEXT_AI_KEY == "YOUR_NEW_OPENROUTER_API_KEY_HERE":
-            return "⚠️ AI service not configured. Please set a valid API key in your .env file."
-        
-        print(f"🔍 Making API request with key: {TEXT_AI_KEY[:20]}...")
-        print(f"🔍 Using base URL: {TEXT_AI_BASE}")
-        print(f"🔍 Using model: {TEXT_AI_MODEL}")
-        
         # Enhanced system prompt for better agricultural responses
         system_prompt = """You are an expert agricultural assistant and crop disease specialist. Your expertise includes:
 
@@ -164,22 +558,50 @@ TIMELINE: When to apply treatments and expect results
 
 Avoid using markdown formatting, emojis, or special characters. Keep it simple and readable."""
 
-        response = text_ai.chat.completions.create(
-            model=TEXT_AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=600,  # Increased for more detailed responses
-            temperature=0.3  # Lower temperature for more focused responses
+        # Earlier turns of the conversation go between the system prompt and the question
+        messages = [
+            {"role": "system", "content": system_prompt},
+            *(history or []),
+            {"role": "user", "content": prompt}
+        ]
+        # Creating the client imports openai, unless the warm-up already did
+        client = text_ai or await asyncio.to_thread(get_text_ai)
+        if on_text is not None:
+            chunks = []
+            try:
+                await asyncio.wait_for(stream_text_model(client, messages, chunks, on_text), timeout=TEXT_AI_TIMEOUT)
+            except asyncio.TimeoutError:
+                if not chunks:
+                    raise
+                print(f"⏱️ Text model stream cut off after {TEXT_AI_TIMEOUT:g}s")
+                return "".join(chunks).strip() + "\n\n" + TEXT_AI_CUT_SHORT_MESSAGE
+            except Exception as e:
+                if not chunks:
+                    raise
+                # Keep what the model already produced
+                print(f"🔍 Text model stream failed part-way: {e}")
+                return "".join(chunks).strip() + "\n\n" + TEXT_AI_INTERRUPTED_MESSAGE
+            return "".join(chunks).strip()
+
+        response = await asyncio.wait_for(
+            client.chat.completions.create(
+                model=TEXT_AI_MODEL,
+                messages=messages,
+                max_tokens=600,  # Increased for more detailed responses
+                temperature=0.3  # Lower temperature for more focused responses
+            ),
+            timeout=TEXT_AI_TIMEOUT
         )
         return response.choices[0].message.content.strip()
+    except asyncio.TimeoutError:
+        print(f"⏱️ Text model call timed out after {TEXT_AI_TIMEOUT:g}s")
+        return TEXT_AI_TIMEOUT_MESSAGE
     except Exception as e:
         error_msg = str(e)
         print(f"🔍 Full error: {error_msg}")
         if "401" in error_msg or "auth" in error_msg.lower():
             service_name = "OpenAI" if AI_SERVICE == "openai" else "OpenRouter"
-            return f"⚠️ {service_name} authentication failed. API Key: {TEXT_AI_KEY[:20]}... Error: {error_msg}"
+            return f"⚠️ {service_name} authentication failed. Please check the API key."
         elif "rate limit" in error_msg.lower():
             return "⚠️ AI service rate limit exceeded. Please try again later."
         else:
@@ -220,12 +642,12 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📸 Processing your image...")
         
         # Retry logic for file download
-        max_retries = 3
+        max_retries = TELEGRAM_DOWNLOAD_RETRIES
         for attempt in range(max_retries):
             try:
                 print(f"Attempting to download file (attempt {attempt + 1}/{max_retries})")
-                file = await photo.get_file()
-                image_bytes = await file.download_as_bytearray()
+                file = await photo.get_file(read_timeout=TELEGRAM_DOWNLOAD_TIMEOUT)
+                image_bytes = await file.download_as_bytearray(read_timeout=TELEGRAM_DOWNLOAD_TIMEOUT)
                 print(f"Successfully downloaded image: {len(image_bytes)} bytes")
                 break
             except TimedOut:
@@ -246,26 +668,31 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send to FastAPI backend for analysis
         try:
             await update.message.reply_text("🔍 Analyzing your crop image...")
-            files = {'file': ('image.jpg', BytesIO(image_bytes), 'image/jpeg')}
-            response = requests.post(FASTAPI_BACKEND_URL, files=files, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-        except requests.exceptions.Timeout:
-            await update.message.reply_text("⏱️ Analysis timed out. The backend service might be slow. Please try again.")
+            result = await analyze_image(image_bytes)
+        except httpx.HTTPStatusError as e:
+            await update.message.reply_text(backend_error_message(e.response))
             return
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             await update.message.reply_text("🔌 Cannot connect to analysis service. Please make sure the backend is running.")
             return
+        except httpx.TimeoutException:
+            await update.message.reply_text("⏱️ Analysis timed out. The backend service might be slow. Please try again.")
+            return
         except Exception as e:
             await update.message.reply_text(f"❌ Error analyzing image: {e}")
             return
 
-        # Build analysis summary
-        summary = build_summary(result)
-        user_memory[user_id] = {"last_summary": summary}
+        if user_busy(user_id):
+            await update.message.reply_text("⏳ I'll analyze this right after your previous question.")
+        # One conversation turn per user at a time, so memory updates stay in order
+        async with user_turn(user_id):
+            # Build analysis summary
+            summary = build_summary(result)
+            # A new photo starts a new conversation
+            await asyncio.to_thread(user_memory.remember_analysis, user_id, summary)
 
-        # Build enhanced prompt with more context
-        context_prompt = f"""CROP DISEASE ANALYSIS REQUEST
+            # Build enhanced prompt with more context
+            context_prompt = f"""CROP DISEASE ANALYSIS REQUEST
 
 {summary}
 
@@ -280,12 +707,13 @@ TASK: Based on the crop and disease identification results above, provide:
 
 Please be specific with product names, application rates, and timing when possible. Focus on practical, actionable advice that a farmer can implement immediately."""
 
-        # Query text model
-        await update.message.reply_text("🤖 Getting expert agricultural analysis...")
-        ai_response = await query_text_model(context_prompt)
-
-        # Reply to user (removed markdown parsing to avoid formatting issues)
-        await update.message.reply_text(ai_response)
+            # Query text model and reply (removed markdown parsing to avoid formatting issues)
+            ai_response = await reply_from_text_model(
+                update.message, context_prompt, "🤖 Getting expert agricultural analysis..."
+            )
+            if is_model_answer(ai_response):
+                question = f"I sent a crop photo for analysis. {caption}".strip()
+                await asyncio.to_thread(user_memory.add_turn, user_id, question, ai_response)
         
     except Exception as e:
         await update.message.reply_text(f"❌ Unexpected error: {e}")
@@ -297,12 +725,18 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     message = update.message.text
 
-    # Use memory if available for context-aware responses
-    memory = user_memory.get(user_id)
+    if user_busy(user_id):
+        # Answers come back in order, one question per user at a time
+        await update.message.reply_text("⏳ I'll answer this right after your previous question.")
+
+    async with user_turn(user_id):
+        # Use memory if available for context-aware responses
+        memory = await asyncio.to_thread(user_memory.get, user_id)
+        history = await asyncio.to_thread(user_memory.history, user_id, MEMORY_HISTORY_TOKENS)
     
-    if memory:
-        # User has previous crop analysis - provide contextual advice
-        enhanced_prompt = f"""FOLLOW-UP AGRICULTURAL CONSULTATION
+        if memory and memory['last_summary']:
+            # User has previous crop analysis - provide contextual advice
+            enhanced_prompt = f"""FOLLOW-UP AGRICULTURAL CONSULTATION
 
 PREVIOUS CROP ANALYSIS:
 {memory['last_summary']}
@@ -318,10 +752,10 @@ TASK: Provide specific, expert agricultural advice that directly addresses the u
 
 Keep the response relevant to crop health and agriculture."""
 
-        ai_response = await query_text_model(enhanced_prompt)
-    else:
-        # No previous analysis - general agricultural question
-        general_prompt = f"""AGRICULTURAL CONSULTATION REQUEST
+            prompt = enhanced_prompt
+        else:
+            # No previous analysis - general agricultural question
+            general_prompt = f"""AGRICULTURAL CONSULTATION REQUEST
 
 USER'S QUESTION: {message}
 
@@ -334,9 +768,11 @@ TASK: As an expert agricultural consultant, provide comprehensive advice on this
 
 Focus on practical, actionable advice that helps improve crop health and farming outcomes."""
 
-        ai_response = await query_text_model(general_prompt)
+            prompt = general_prompt
     
-    await update.message.reply_text(ai_response)
+        ai_response = await reply_from_text_model(update.message, prompt, "💭 Thinking...", history)
+        if is_model_answer(ai_response):
+            await asyncio.to_thread(user_memory.add_turn, user_id, message, ai_response)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_message = """Crop Disease Detection Bot - Help Guide
@@ -370,6 +806,11 @@ Follow-up: After photo analysis, ask specific questions for detailed guidance!""
 
     await update.message.reply_text(help_message)
 
+async def record_first_update(update: object, context: ContextTypes.DEFAULT_TYPE):
+    if "first update" not in STARTUP_EVENTS:
+        STARTUP_EVENTS["first update"] = elapsed_ms()
+        print(startup_summary())
+
 # ====== ERROR HANDLER ======
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
@@ -385,27 +826,112 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         except Exception:
             pass  # If we can't send a message, just ignore it
 
+# ====== WEBHOOK ======
+
+async def serve_webhook(app):
+    """Run the bot with updates posted to an embedded web server instead of polling"""
+    with timed_import("uvicorn", lazy=True):
+        import uvicorn
+        from starlette.applications import Starlette
+        from starlette.responses import PlainTextResponse, Response
+        from starlette.routing import Route
+
+    async def receive_update(request):
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        # Compared as bytes: compare_digest rejects non-ASCII str values with TypeError
+        if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+            return Response(status_code=403)
+        try:
+            update = Update.de_json(await request.json(), app.bot)
+        except (ValueError, TypeError, KeyError):
+            return Response(status_code=400)
+        # Handlers run in the background; Telegram only waits for the queue
+        await app.update_queue.put(update)
+        return Response()
+
+    async def health(request):
+        return PlainTextResponse("ok")
+
+    server = uvicorn.Server(uvicorn.Config(
+        Starlette(routes=[
+            Route(WEBHOOK_PATH, receive_update, methods=["POST"]),
+            Route("/health", health, methods=["GET"])
+        ]),
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        limit_concurrency=WEBHOOK_MAX_CONCURRENCY,
+        timeout_graceful_shutdown=WEBHOOK_SHUTDOWN_TIMEOUT,
+        log_level="warning"
+    ))
+
+    # run_polling() calls the post_init and post_shutdown hooks itself; here it is done by hand
+    await app.initialize()
+    try:
+        if WEBHOOK_REGISTER:
+            await app.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+            print(f"🔗 Webhook registered at {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        await app.post_init(app)
+        await app.start()
+        print(f"🌐 Listening for updates on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        try:
+            # Returns after SIGINT/SIGTERM, once open requests have finished
+            await server.serve()
+        finally:
+            # Handle the updates already received before the clients are closed
+            print("🛑 Finishing pending updates...")
+            await app.stop()
+    finally:
+        await app.shutdown()
+        await app.post_shutdown(app)
+
 # ====== MAIN ======
 
 def main():
     try:
         print("🔧 Initializing bot...")
+        if not BOT_TOKEN:
+            print("❌ TELEGRAM_BOT_TOKEN is not set. Copy .env.example to .env and add your bot token")
+            return
         
-        # Configure bot with longer timeouts
-        app = (
+        # Configure bot with longer timeouts; updates are handled concurrently so
+        # one slow analysis does not hold up other users
+        builder = (
             ApplicationBuilder()
             .token(BOT_TOKEN)
-            .read_timeout(30)
-            .write_timeout(30)
-            .connect_timeout(30)
-            .pool_timeout(30)
-            .build()
+            .base_url(TELEGRAM_API_URL)
+            .base_file_url(TELEGRAM_FILE_URL)
+            .read_timeout(TELEGRAM_TIMEOUT)
+            .write_timeout(TELEGRAM_TIMEOUT)
+            .connect_timeout(TELEGRAM_TIMEOUT)
+            .pool_timeout(TELEGRAM_TIMEOUT)
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .post_init(start_background_warm_up)
+            .post_shutdown(close_clients)
         )
+        if BOT_MODE == "webhook":
+            if not WEBHOOK_SECRET or (WEBHOOK_REGISTER and not WEBHOOK_URL):
+                print("❌ Webhook mode needs WEBHOOK_SECRET, and WEBHOOK_URL unless WEBHOOK_REGISTER=false")
+                return
+            if importlib.util.find_spec("uvicorn") is None or importlib.util.find_spec("starlette") is None:
+                print("❌ Webhook mode needs uvicorn and starlette: pip install -r requirements.txt")
+                return
+            # Updates arrive through serve_webhook(), so no polling updater is needed
+            builder = builder.updater(None)
+        app = builder.build()
         print("✅ Bot application created successfully")
 
         # Add error handler
         app.add_error_handler(error_handler)
         
+        # Runs before the other handlers, only to time the first update
+        app.add_handler(TypeHandler(Update, record_first_update), group=-1)
+        
         # Add command and message handlers
         app.add_handler(CommandHandler("start", start))
         app.add_handler(CommandHandler("help", help_command))
@@ -414,11 +940,14 @@ def main():
         print("✅ Handlers registered successfully")
 
         print("🤖 Bot is running...")
-        print("🔗 Bot token:", BOT_TOKEN[:20] + "..." if len(BOT_TOKEN) > 20 else BOT_TOKEN)
-        print(f"🤖 AI Service: {AI_SERVICE.upper()}")
-        print("🔑 API key:", TEXT_AI_KEY[:20] + "..." if TEXT_AI_KEY and len(TEXT_AI_KEY) > 20 else "NOT SET")
-        print("⏱️ Configured with 30s timeouts for better reliability")
-        app.run_polling()
+        print(f"🤖 AI Service: {AI_SERVICE.upper()} ({TEXT_AI_MODEL})")
+        print("🔑 API key:", "set" if TEXT_AI_KEY else "NOT SET")
+        print(f"⏱️ Configured with {TELEGRAM_TIMEOUT:.0f}s Telegram timeouts, {BACKEND_READ_TIMEOUT:.0f}s analysis timeout")
+        print(f"👥 Handling up to {CONCURRENT_UPDATES} updates at once")
+        if BOT_MODE == "webhook":
+            asyncio.run(serve_webhook(app))
+        else:
+            app.run_polling()
     except Exception as e:
         print(f"❌ Error starting bot: {e}")
         import traceback
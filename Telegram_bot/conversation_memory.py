@@ -0,0 +1,144 @@
+"""
+Conversation Memory
+-------------------
+Per-user bot memory: the last crop analysis summary and the recent
+question/answer turns. Kept in an LRU with TTL eviction, optionally backed by
+a SQLite file so it survives restarts and can be shared by several bot
+processes
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory (user_id INTEGER PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS memory_updated_at ON memory (updated_at);
+"""
+
+
+def estimate_tokens(text):
+    """Rough token count for English text (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """LRU with TTL per user, with an optional SQLite tier
+
+    Entries are dicts with last_summary, turns (a list of question/answer
+    pairs, oldest first) and updated_at. With a database, every write goes
+    through to it and reads pick up newer entries written by other
+    processes. Methods are blocking; call them through asyncio.to_thread
+    when a database is used.
+    """
+
+    def __init__(self, max_users=1000, ttl=86400, max_turns=10, db_path=None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.db_path = db_path
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, user_id):
+        """Return the user's memory entry, or None if there is none or it expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry["updated_at"] + self.ttl < now:
+                del self._entries[user_id]
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+
+        if self.db_path:
+            # Only fetch the row when another process wrote a newer one
+            known = entry["updated_at"] if entry is not None else now - self.ttl
+            row = self._connection().execute(
+                "SELECT value FROM memory WHERE user_id = ? AND updated_at > ?", (user_id, known)
+            ).fetchone()
+            if row is not None:
+                entry = json.loads(row[0])
+                self._store(user_id, entry)
+        return entry
+
+    def remember_analysis(self, user_id, summary):
+        """Start a new conversation around a fresh crop analysis"""
+        self._save(user_id, {"last_summary": summary, "turns": []})
+
+    def add_turn(self, user_id, question, answer):
+        entry = self.get(user_id) or {"last_summary": None, "turns": []}
+        turns = entry["turns"] + [{"question": question, "answer": answer}]
+        self._save(user_id, {"last_summary": entry["last_summary"], "turns": turns[-self.max_turns:]})
+
+    def history(self, user_id, token_budget):
+        """Recent turns as chat messages, newest kept first, within token_budget
+
+        Older turns are dropped once the budget is spent; when the latest
+        answer alone exceeds it, that answer is cut to fit.
+        """
+        entry = self.get(user_id)
+        if entry is None:
+            return []
+        messages = []
+        remaining = token_budget
+        for turn in reversed(entry["turns"]):
+            cost = estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"])
+            if cost > remaining:
+                if not messages and remaining > estimate_tokens(turn["question"]):
+                    answer_chars = (remaining - estimate_tokens(turn["question"])) * 4
+                    messages = [
+                        {"role": "user", "content": turn["question"]},
+                        {"role": "assistant", "content": turn["answer"][:answer_chars] + " ..."}
+                    ]
+                break
+            remaining -= cost
+            messages = [
+                {"role": "user", "content": turn["question"]},
+                {"role": "assistant", "content": turn["answer"]}
+            ] + messages
+        return messages
+
+    def _save(self, user_id, entry):
+        entry["updated_at"] = time.time()
+        self._store(user_id, entry)
+        if self.db_path:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO memory (user_id, value, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(entry), entry["updated_at"])
+            )
+            self._writes += 1
+            # Expired rows are only removed now and then
+            if self._writes % 100 == 0:
+                connection.execute("DELETE FROM memory WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def _store(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Mock Telegram Bot API
+---------------------
+Local stand-in for the Telegram Bot API plus a harness that posts sample
+updates to the bot's webhook, so webhook mode (BOT_MODE=webhook) can be
+tested offline.
+
+Usage:
+    python mock_telegram.py serve --port 9200
+    python mock_telegram.py post --webhook http://127.0.0.1:8443/telegram --secret s3cret --updates 20
+
+Point the bot at the mock with:
+    TELEGRAM_API_URL=http://127.0.0.1:9200/bot
+    TELEGRAM_FILE_URL=http://127.0.0.1:9200/file/bot
+    BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8443 WEBHOOK_SECRET=s3cret WEBHOOK_PORT=8443
+
+"post" first checks that requests without the secret, with a wrong one and
+with a non-ASCII one are refused with 403, then posts text updates from
+distinct chats and reports how long the bot took to reply to each.
+"""
+
+import time
+import asyncio
+import argparse
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app():
+    """Build the mock Bot API app
+
+    Every method call is recorded and available from GET /calls; methods
+    that return a message echo the text back.
+    """
+    calls = []
+    message_ids = iter(range(1, 10 ** 9))
+
+    async def read_params(request):
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith(("multipart/", "application/x-www-form-urlencoded")):
+            return {key: str(value) for key, value in (await request.form()).items()}
+        body = await request.body()
+        return await request.json() if body else dict(request.query_params)
+
+    async def bot_method(request):
+        method = request.path_params["method"]
+        params = await read_params(request)
+        calls.append({"time": time.time(), "method": method, "chat_id": params.get("chat_id"), "text": params.get("text")})
+
+        if method == "getMe":
+            result = {
+                "id": 1, "is_bot": True, "first_name": "Mock", "username": "mock_cdi_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": int(params.get("message_id") or next(message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params.get("text", "")
+            }
+        else:
+            # setWebhook, deleteWebhook, sendChatAction, ...
+            result = True
+        return JSONResponse({"ok": True, "result": result})
+
+    async def get_calls(request):
+        since = float(request.query_params.get("since", 0))
+        return JSONResponse([call for call in calls if call["time"] >= since])
+
+    return Starlette(routes=[
+        Route("/bot{token}/{method}", bot_method, methods=["GET", "POST"]),
+        Route("/calls", get_calls)
+    ])
+
+
+def sample_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Farmer"},
+            "text": text
+        }
+    }
+
+
+async def post_updates(webhook, secret, api, updates, text, settle, timeout):
+    """Post sample updates to the webhook and report reply latencies from the mock API"""
+    secret_header = "X-Telegram-Bot-Api-Secret-Token"
+    async with httpx.AsyncClient(timeout=30) as client:
+        for label, headers in (
+            ("no secret", {}),
+            ("wrong secret", {secret_header: "wrong"}),
+            ("non-ASCII secret", {secret_header: "geheim-é".encode()})
+        ):
+            response = await client.post(webhook, json=sample_update(1, 1, text), headers=headers)
+            status = "ok" if response.status_code == 403 else "UNEXPECTED"
+            print(f"{label}: HTTP {response.status_code} ({status})")
+
+        started = time.time()
+        chats = {1000 + index: None for index in range(updates)}
+        responses = await asyncio.gather(*(
+            client.post(webhook, json=sample_update(10 + index, chat_id, text), headers={secret_header: secret})
+            for index, chat_id in enumerate(chats)
+        ))
+        acknowledged = time.time() - started
+        codes = sorted({response.status_code for response in responses})
+        print(f"posted {updates} updates: HTTP {codes}, acknowledged in {acknowledged * 1000:.0f}ms")
+
+        # Wait until the bot has been quiet for `settle` seconds
+        last_activity = time.time()
+        while time.time() - started < timeout:
+            await asyncio.sleep(0.2)
+            calls = (await client.get(f"{api}/calls", params={"since": started})).json()
+            if calls:
+                last_activity = max(last_activity, calls[-1]["time"])
+            if time.time() - last_activity >= settle:
+                break
+
+    first_reply = {}
+    last_reply = {}
+    for call in calls:
+        if call["method"] not in ("sendMessage", "editMessageText") or call["chat_id"] is None:
+            continue
+        chat_id = int(call["chat_id"])
+        if chat_id in chats:
+            first_reply.setdefault(chat_id, call["time"] - started)
+            last_reply[chat_id] = call["time"] - started
+
+    answered = len(last_reply)
+    print(f"chats answered: {answered}/{updates}")
+    if answered:
+        firsts = sorted(first_reply.values())
+        lasts = sorted(last_reply.values())
+        print(f"first reply: median {firsts[len(firsts) // 2]:.2f}s, max {firsts[-1]:.2f}s")
+        print(f"last edit:   median {lasts[len(lasts) // 2]:.2f}s, max {lasts[-1]:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Telegram Bot API and webhook harness")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the mock Bot API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=9200)
+
+    post = commands.add_parser("post", help="Post sample updates to the bot's webhook")
+    post.add_argument("--webhook", default="http://127.0.0.1:8443/telegram", help="Bot webhook URL")
+    post.add_argument("--secret", required=True, help="WEBHOOK_SECRET the bot was started with")
+    post.add_argument("--api", default="http://127.0.0.1:9200", help="Mock Bot API base URL")
+    post.add_argument("--updates", type=int, default=10, help="Updates to post, one chat each")
+    post.add_argument("--text", default="How do I treat early blight on tomatoes?")
+    post.add_argument("--settle", type=float, default=3.0, help="Seconds without bot activity that end the run")
+    post.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
+    else:
+        asyncio.run(post_updates(args.webhook, args.secret, args.api.rstrip("/"), args.updates,
+                                 args.text, args.settle, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
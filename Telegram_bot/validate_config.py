@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Configuration validator for the CDI Telegram bot
+Checks if all required environment variables are properly set
+"""
+
+import os
+from dotenv import load_dotenv
+
+def validate_bot_config():
+    """Validate CDI Telegram bot configuration"""
+
+    print("=" * 60)
+    print("CDI TELEGRAM BOT CONFIGURATION VALIDATOR")
+    print("=" * 60)
+
+    # Load environment variables
+    load_dotenv()
+
+    ai_service = os.getenv("AI_SERVICE", "openrouter")
+    bot_mode = os.getenv("BOT_MODE", "polling").lower()
+
+    # Required environment variables
+    required_vars = {
+        "TELEGRAM_BOT_TOKEN": "Telegram bot token from @BotFather"
+    }
+    if ai_service == "openai":
+        required_vars["OPENAI_API_KEY"] = "OpenAI API key for answering questions"
+    else:
+        required_vars["OPENROUTER_API_KEY"] = "OpenRouter API key for answering questions"
+    if bot_mode == "webhook":
+        required_vars["WEBHOOK_SECRET"] = "Secret Telegram sends with every webhook request"
+        if os.getenv("WEBHOOK_REGISTER", "true").lower() == "true":
+            required_vars["WEBHOOK_URL"] = "Public HTTPS URL Telegram posts updates to"
+
+    # Optional environment variables with defaults
+    optional_vars = {
+        "AI_SERVICE": ("openrouter", "Text model service: openrouter or openai"),
+        "FASTAPI_BACKEND_URL": ("http://localhost:8000/analyze", "CDI Backend analyze endpoint"),
+        "BACKEND_CONNECT_TIMEOUT": ("5", "Backend connect timeout in seconds"),
+        "BACKEND_WRITE_TIMEOUT": ("15", "Seconds allowed to upload a photo to the backend"),
+        "BACKEND_READ_TIMEOUT": ("45", "Seconds to wait for an analysis"),
+        "BACKEND_POOL_TIMEOUT": ("10", "Seconds to wait for a pooled backend connection"),
+        "BACKEND_MAX_CONNECTIONS": ("64", "Maximum open backend connections"),
+        "BACKEND_RETRIES": ("2", "Retries for connection failures and 502/503/504"),
+        "BACKEND_RETRY_BACKOFF": ("1", "First retry delay in seconds, doubled each retry"),
+        "TEXT_AI_MAX_CONCURRENCY": ("16", "Text model calls in flight across all users"),
+        "TEXT_AI_QUEUE_TIMEOUT": ("30", "Seconds to wait for a free text model slot"),
+        "TEXT_AI_TIMEOUT": ("45", "Per-call text model timeout in seconds"),
+        "STREAM_REPLIES": ("true", "Edit answers into the reply as they are generated"),
+        "STREAM_EDIT_INTERVAL": ("1.0", "Minimum seconds between reply edits"),
+        "TELEGRAM_DOWNLOAD_TIMEOUT": ("30", "Photo download timeout in seconds"),
+        "TELEGRAM_DOWNLOAD_RETRIES": ("3", "Photo download attempts"),
+        "TELEGRAM_TIMEOUT": ("30", "Bot API call timeout in seconds"),
+        "CONCURRENT_UPDATES": ("64", "Updates handled at once"),
+        "TELEGRAM_POOL_SIZE": ("32", "Connections for Bot API calls"),
+        "TELEGRAM_API_URL": ("https://api.telegram.org/bot", "Bot API endpoint"),
+        "TELEGRAM_FILE_URL": ("https://api.telegram.org/file/bot", "Bot API file download endpoint"),
+        "MEMORY_MAX_USERS": ("1000", "Users whose conversations are kept in memory"),
+        "MEMORY_TTL": ("86400", "Seconds a conversation is remembered"),
+        "MEMORY_MAX_TURNS": ("10", "Question/answer turns stored per user"),
+        "MEMORY_HISTORY_TOKENS": ("1500", "Token budget for history sent with a question"),
+        "MEMORY_DB": ("", "SQLite file that persists and shares conversations"),
+        "BOT_MODE": ("polling", "polling or webhook"),
+        "WEBHOOK_PATH": ("/telegram", "Path the webhook is served on"),
+        "WEBHOOK_HOST": ("0.0.0.0", "Webhook server host"),
+        "WEBHOOK_PORT": ("8443", "Webhook server port"),
+        "WEBHOOK_REGISTER": ("true", "Register the webhook with Telegram on startup"),
+        "WEBHOOK_MAX_CONNECTIONS": ("40", "Parallel deliveries Telegram makes (1-100)"),
+        "WEBHOOK_MAX_CONCURRENCY": ("100", "Requests accepted at once before answering 503"),
+        "WEBHOOK_SHUTDOWN_TIMEOUT": ("30", "Seconds to finish in-flight updates on shutdown")
+    }
+
+    all_good = True
+
+    print("\n🔍 CHECKING REQUIRED VARIABLES:")
+    print("-" * 40)
+
+    for var_name, description in required_vars.items():
+        if os.getenv(var_name):
+            print(f"✅ {var_name}: {description}")
+            print(f"   Status: set")
+        else:
+            print(f"❌ {var_name}: {description}")
+            print(f"   Status: NOT SET")
+            all_good = False
+        print()
+
+    print("\n🔧 CHECKING OPTIONAL VARIABLES:")
+    print("-" * 40)
+
+    for var_name, (default_value, description) in optional_vars.items():
+        value = os.getenv(var_name, default_value)
+        print(f"✅ {var_name}: {description}")
+        print(f"   Value: {value}")
+        print()
+
+    print("\n📋 CONFIGURATION SUMMARY:")
+    print("-" * 40)
+
+    if all_good:
+        print("✅ All required environment variables are set!")
+        print("✅ CDI Telegram bot is properly configured!")
+        print("\n🚀 Ready to start:")
+        print("   python CDI_telegram_bot.py")
+    else:
+        print("❌ Some required environment variables are missing!")
+        print("\n🔧 To fix this:")
+        print("1. Copy .env.example to .env")
+        print("2. Edit .env and add your actual keys")
+        print("3. Run this validator again")
+
+    return all_good
+
+if __name__ == "__main__":
+    success = validate_bot_config()
+
+    if not success:
+        print("\n" + "="*60)
+        print("CONFIGURATION INCOMPLETE")
+        print("="*60)
+        exit(1)
+    else:
+        print("\n" + "="*60)
+        print("CONFIGURATION VALID")
+        print("="*60)